@@ -1,19 +1,69 @@
-from flask import Flask, render_template, request, Response, stream_with_context
-import process as fss
-import pandas as pd
-import base64
-import matplotlib.pyplot as plt
+from flask import Flask, render_template, request, Response, stream_with_context, jsonify, abort, url_for
+import os
+import re
 import sys
 import io
+import json
+import uuid
+import shutil
 
 import download_info as di
 import top_stocks as ts
 import process as p
 import chart_combined as cc
 import chart_available_dates as cad
+import results_export as rx
+import prefetch as pf
 
 app = Flask(__name__)
 
+# Completed runs are written to disk under their run id, so the results endpoints work
+# whichever worker process serves them; only the latest MAX_STORED_RUNS are kept
+RUNS_DIR = os.path.join(di.CACHE_DIR, "runs")
+MAX_STORED_RUNS = 20
+
+
+def run_summary(run):
+    # Parameters, metrics and counts of a completed run, as stored in run.json
+    return {
+        'parameters': run['parameters'],
+        'metrics': {key: float(value) for key, value in run['metrics'].items()},
+        'average_stock_return': run['average_stock_return'],
+        'average_stock_annual_return': run['average_stock_annual_return'],
+        'first_valid_date': str(run['first_valid_date'].date()) if run['first_valid_date'] is not None else None,
+        'last_valid_date': str(run['last_valid_date'].date()) if run['last_valid_date'] is not None else None,
+        'num_days': len(run['investment_results']),
+        'num_trades': sum(1 for trade in run['trade_log'] if trade['action'] == 'buy'),
+        'num_free_capital_errors': len(run['free_capital_errors'])
+    }
+
+
+def store_run(run):
+    # Writes a completed run's summary and tables to RUNS_DIR/<run_id>, dropping the oldest runs
+    run_id = uuid.uuid4().hex
+    run_dir = os.path.join(RUNS_DIR, run_id)
+    tmp_dir = run_dir + '.tmp'
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, 'run.json'), 'w') as f:
+        json.dump(run_summary(run), f, indent=1, default=str)
+    rx.write_tables(run, tmp_dir)
+    os.rename(tmp_dir, run_dir)  # Other workers only ever see complete runs
+
+    stored = sorted((entry for entry in os.scandir(RUNS_DIR) if entry.is_dir() and not entry.name.endswith('.tmp')),
+                    key=lambda entry: entry.stat().st_mtime_ns)
+    for entry in stored[:-MAX_STORED_RUNS]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return run_id
+
+
+def get_run_dir(run_id):
+    # Directory of a stored run (run ids are hex strings, so they never leave RUNS_DIR)
+    run_dir = os.path.join(RUNS_DIR, run_id)
+    if not re.fullmatch(r'[0-9a-f]{32}', run_id) or not os.path.isdir(run_dir):
+        abort(404, description=f"No completed run {run_id} (only the last {MAX_STORED_RUNS} runs are kept)")
+    return run_dir
+
+
 @app.route('/', methods=['GET'])
 def home():
     # Default values for the form fields
@@ -76,11 +126,12 @@ def stream_process(api_key, tickers, days_after_dividend, days_before_earnings,
     # Process market cap data
     yield "Processing market cap data...<br>\n"
     market_caps = p.process_market_caps(downloaded_data)
-    top_stocks_by_date = ts.create_top_stocks_by_date(market_caps, start_date, end_date, num_stocks)
+    top_stocks_membership = ts.create_top_stocks_membership(market_caps, start_date, end_date, num_stocks)
+    top_stocks_by_date = top_stocks_membership.to_frame()  # One row per day, for calculate_returns
     yield "Market cap processing complete.<br>\n"
 
     # Second chart (top stocks over time)
-    plot_top_stocks_base64 = ts.chart_top_stocks(top_stocks_by_date)
+    plot_top_stocks_base64 = ts.chart_top_stocks(top_stocks_membership)
     yield f" "  # Flush the stream
     yield f'<img src="data:image/png;base64,{plot_top_stocks_base64}"><br>\n'
 
@@ -125,7 +176,8 @@ def stream_process(api_key, tickers, days_after_dividend, days_before_earnings,
 
     # Process investment strategy
     yield "Processing investment strategy...<br>\n"
-    investment_results, free_capital_errors = p.process(downloaded_data, top_stocks_by_date, days_after_dividend, days_before_earnings, initial_investment, num_pools)
+    trade_log = []
+    investment_results, free_capital_errors = p.process(downloaded_data, top_stocks_membership, days_after_dividend, days_before_earnings, initial_investment, num_pools, trade_log=trade_log)
     yield "Investment strategy processed.<br>\n"
 
     # Get the captured output and make it ready for rendering
@@ -169,8 +221,59 @@ def stream_process(api_key, tickers, days_after_dividend, days_before_earnings,
 
     yield f"<pre>{output}</pre>"
 
+    # Keep the results for the JSON / Arrow / Parquet endpoints
+    run_id = store_run({
+        'parameters': {'tickers': tickers_list, 'days_after_dividend': days_after_dividend, 'days_before_earnings': days_before_earnings,
+                       'start_date': start_date, 'end_date': end_date, 'initial_investment': initial_investment,
+                       'num_pools': num_pools, 'num_stocks': num_stocks},
+        'metrics': metrics,
+        'average_stock_return': avg_percent_return,
+        'average_stock_annual_return': avg_annual_return,
+        'first_valid_date': first_valid_date,
+        'last_valid_date': last_valid_date,
+        'investment_results': investment_results,
+        'free_capital_errors': free_capital_errors,
+        'trade_log': trade_log,
+        'returns_data': returns_data
+    })
+    yield f"Results: <a href='{url_for('results', run_id=run_id)}'>JSON</a>"
+    for table in rx.TABLES:
+        yield f" | {table}: " + ", ".join(f"<a href='{url_for('results_table', run_id=run_id, table=table, output_format=output_format)}'>{output_format}</a>"
+                                          for output_format in rx.FORMATS)
+    yield "<br>\n"
+
     yield "Simulation complete!<br>\n"
 
 
+@app.route('/prefetch/status', methods=['GET'])
+def prefetch_status():
+    # Progress and API calls used by the cache warm-up (see prefetch.py)
+    return jsonify(pf.read_status())
+
+
+@app.route('/results/<run_id>', methods=['GET'])
+def results(run_id):
+    # Summary of a completed run, with links to its tables
+    with open(os.path.join(get_run_dir(run_id), 'run.json'), 'r') as f:
+        summary = json.load(f)
+    return jsonify({
+        'run_id': run_id,
+        **summary,
+        'tables': {table: {output_format: url_for('results_table', run_id=run_id, table=table, output_format=output_format)
+                           for output_format in rx.FORMATS}
+                   for table in rx.TABLES}
+    })
+
+
+@app.route('/results/<run_id>/<table>.<output_format>', methods=['GET'])
+def results_table(run_id, table, output_format):
+    # One table of a completed run, streamed as Arrow IPC, Parquet or JSON
+    run_dir = get_run_dir(run_id)
+    if table not in rx.TABLES or output_format not in rx.FORMATS:
+        abort(404, description=f"Tables: {rx.TABLES}, formats: {list(rx.FORMATS)}")
+    headers = {'Content-Disposition': f"attachment; filename={table}.{output_format}"} if output_format != 'json' else {}
+    return Response(rx.stream_stored_table(run_dir, table, output_format), content_type=rx.FORMATS[output_format], headers=headers)
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import contextlib
+import pandas as pd
+
+import download_info as di
+import top_stocks as ts
+import process as p
+import calendar_rules as cr
+import breakout_conditions as bc
+
+# Headless batch runner for scheduled jobs.
+#
+# Runs download -> process_market_caps -> create_top_stocks_membership -> process ->
+# metrics for every combination in a config file, without rendering any charts,
+# and writes metrics, equity curves and trade logs to Parquet (or JSON).
+#
+# Usage:
+#     python batch_runner.py batch_config.example.json --output results
+#
+# Config keys (JSON, or YAML for .yml/.yaml files):
+#     api_key              EODHD key (or set the EODHD_API_KEY environment variable)
+#     tickers              list or comma-separated string
+#     date_ranges          list of {"start_date": ..., "end_date": ...}
+#                          (or plain start_date/end_date keys for a single range)
+#     days_after_dividend, days_before_earnings, num_pools, num_stocks,
+#     initial_investment   a value, or a list of values to run as a grid
+#     entry_rule, exit_rule     optional calendar_rules rules (dicts); an entry_rule replaces
+#                          days_after_dividend and an exit_rule days_before_earnings, so
+#                          those keys may not be set alongside them
+#     breakout_conditions       optional list of breakout_conditions conditions (dicts)
+#     allocation           optional pool allocation policy (see pool_manager.ALLOCATION_POLICIES)
+#     checkpoint_dir       optional directory for simulation checkpoints: a daily job that
+#                          only moves end_date forward then simulates just the new days
+#                          (see checkpoint_name; configs may share a directory)
+
+GRID_PARAMETERS = ['days_after_dividend', 'days_before_earnings', 'num_pools', 'num_stocks', 'initial_investment']
+DEFAULTS = {'days_after_dividend': 0, 'days_before_earnings': 0, 'num_pools': 10, 'num_stocks': 10, 'initial_investment': 1000}
+FORMATS = ['parquet', 'json']
+RULE_OVERRIDES = {'entry_rule': 'days_after_dividend', 'exit_rule': 'days_before_earnings'}  # Rule -> parameter it replaces
+CHECKPOINT_SETTINGS = {'entry_rule': None, 'exit_rule': None, 'allocation': 'first_free', 'breakout_conditions': []}  # -> default
+
+
+def load_config(path):
+    with open(path, 'r') as f:
+        if path.endswith(('.yml', '.yaml')):
+            import yaml  # Only needed for YAML configs
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+
+    config['api_key'] = config.get('api_key') or os.environ.get('EODHD_API_KEY')
+    if not config['api_key']:
+        raise ValueError("No API key: set api_key in the config or the EODHD_API_KEY environment variable")
+    if isinstance(config['tickers'], str):
+        config['tickers'] = config['tickers'].split(',')
+    if 'date_ranges' not in config:
+        config['date_ranges'] = [{'start_date': config['start_date'], 'end_date': config['end_date']}]
+    return config
+
+
+def grid_parameters(config):
+    # The grid parameters that apply: those replaced by an entry/exit rule are left out
+    # (process ignores them), and setting them anyway is an error rather than a grid of
+    # identical runs
+    names = list(GRID_PARAMETERS)
+    for rule, name in RULE_OVERRIDES.items():
+        if config.get(rule):
+            if name in config:
+                raise ValueError(f"{name} has no effect when {rule} is set; remove it from the config")
+            names.remove(name)
+    return names
+
+
+def expand_grid(config):
+    # Every combination of the grid parameters, scalars counting as one-value lists
+    names = grid_parameters(config)
+    values = []
+    for name in names:
+        value = config.get(name, DEFAULTS[name])
+        values.append(value if isinstance(value, list) else [value])
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def write_table(df, path, output_format):
+    # Writes a DataFrame as <path>.parquet or <path>.json (records, ISO dates)
+    if output_format == 'parquet':
+        df.to_parquet(f"{path}.parquet")
+    else:
+        df.to_json(f"{path}.json", orient='records', date_format='iso', indent=1)
+
+
+def checkpoint_name(config, start_date, params):
+    """
+    Names a run's checkpoint file by everything but its end date.
+
+    The start date and grid values are written out; the rules, allocation and breakout
+    conditions are added as a short hash, so configs that differ only in those keep
+    separate checkpoints in the same checkpoint_dir.
+
+    Returns:
+        str: File name without extension.
+    """
+    settings = json.dumps({key: config.get(key, default) for key, default in CHECKPOINT_SETTINGS.items()}, sort_keys=True, default=str)
+    settings_hash = hashlib.sha1(settings.encode()).hexdigest()[:10]
+    return '_'.join([start_date] + [str(value) for value in params.values()] + [settings_hash])
+
+
+def run_batch(config, output_dir, output_format='parquet'):
+    """
+    Runs every configured date range and parameter combination.
+
+    Args:
+        config (dict): Loaded config (see load_config).
+        output_dir (str): Directory for the results (one sub-directory per run).
+        output_format (str): 'parquet' or 'json' for the tables.
+
+    Returns:
+        list: One summary dict per run (also written to summary.json).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    runs = expand_grid(config)
+    entry_rule = config.get('entry_rule')
+    exit_rule = config.get('exit_rule')
+    conditions = [bc.breakout_condition(c['type'], c.get('action', 'block'), **c.get('params', {}))
+                  for c in config.get('breakout_conditions', [])]
+    summary = []
+    run_number = 0
+
+    # Per-trade diagnostics go to a log file instead of the console
+    with open(os.path.join(output_dir, 'run.log'), 'w') as log, contextlib.redirect_stdout(log):
+        for date_range in config['date_ranges']:
+            start_date, end_date = date_range['start_date'], date_range['end_date']
+
+            downloaded_data = di.download_data(config['api_key'], config['tickers'], start_date, end_date)
+            downloaded_data = p.remove_tickers_without_dividends(downloaded_data)
+            market_caps = p.process_market_caps(downloaded_data)
+
+            # Masks are converted to date lookups once, not by every simulation of the grid
+            block_mask, exit_mask = (map(bc.mask_to_lookup, bc.build_masks(downloaded_data, conditions, start_date, end_date))
+                                     if conditions else (None, None))
+
+            top_stocks_cache = {}
+            for params in runs:
+                if params['num_stocks'] not in top_stocks_cache:
+                    membership = ts.create_top_stocks_membership(market_caps, start_date, end_date, params['num_stocks'])
+                    top_stocks_cache[params['num_stocks']] = (membership, membership.to_frame())
+                top_stocks_membership, top_stocks_by_date = top_stocks_cache[params['num_stocks']]
+
+                run_name = f"run_{run_number:03d}"
+                run_dir = os.path.join(output_dir, run_name)
+                os.makedirs(run_dir, exist_ok=True)
+                run_number += 1
+                print(f"\n=== {run_name}: {start_date} - {end_date} {params}")
+
+                _, avg_percent_return, avg_annual_return, _, _ = p.calculate_returns(
+                    downloaded_data, start_date, end_date, top_stocks_by_date, params['num_stocks'])
+
+                # Checkpoints are keyed by everything but the end date, so the next day's run resumes them
+                checkpoint_path = None
+                if config.get('checkpoint_dir'):
+                    checkpoint_path = os.path.join(config['checkpoint_dir'], f"{checkpoint_name(config, start_date, params)}.pkl")
+
+                trade_log = []
+                investment_results, free_capital_errors = p.process(
+                    downloaded_data, top_stocks_membership, params.get('days_after_dividend', 0), params.get('days_before_earnings', 0),
+                    params['initial_investment'], params['num_pools'],
+                    entry_rule=cr.calendar_rule(**entry_rule) if entry_rule else None,
+                    exit_rule=cr.calendar_rule(**exit_rule) if exit_rule else None,
+                    block_mask=block_mask, exit_mask=exit_mask, trade_log=trade_log, checkpoint_path=checkpoint_path,
+                    allocation=config.get('allocation', 'first_free'), record_pool_capital=False)  # Only totals are written
+                metrics = p.calculate_strategy_metrics(investment_results, start_date, end_date, params['initial_investment'])
+
+                run_summary = {
+                    'run': run_name,
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    **params,
+                    **{key: float(value) for key, value in metrics.items()},
+                    'average_stock_return': avg_percent_return,
+                    'average_stock_annual_return': avg_annual_return,
+                    'num_trades': sum(1 for trade in trade_log if trade['action'] == 'buy'),
+                    'num_free_capital_errors': len(free_capital_errors)
+                }
+                summary.append(run_summary)
+
+                with open(os.path.join(run_dir, 'metrics.json'), 'w') as f:
+                    json.dump(run_summary, f, indent=1, default=str)
+                write_table(p.investment_results_to_equity(investment_results), os.path.join(run_dir, 'equity'), output_format)
+                write_table(pd.DataFrame(trade_log, columns=['date', 'action', 'ticker', 'pool', 'price', 'amount', 'gain', 'forced_exit']),
+                            os.path.join(run_dir, 'trades'), output_format)
+                write_table(pd.DataFrame(free_capital_errors, columns=['ticker', 'date']),
+                            os.path.join(run_dir, 'free_capital_errors'), output_format)
+
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=1, default=str)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the food stock strategy simulation without charts.")
+    parser.add_argument('config', help="JSON or YAML config file")
+    parser.add_argument('--output', default='results', help="Output directory (default: results)")
+    parser.add_argument('--format', default='parquet', choices=FORMATS, help="Table format (default: parquet)")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(load_config(args.config), args.output, args.format)
+    for run in summary:
+        print(f"{run['run']}: overall {run['overall_return']:.2f}%, annualized {run['annualized_return']:.2f}%")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
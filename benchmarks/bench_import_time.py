@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import subprocess
+
+# Import-time benchmark.
+#
+# Each module is imported in a fresh interpreter (best of several runs) and timed.
+# The simulation-only path must stay under its budget and must not pull in the
+# heavy optional dependencies (matplotlib, Flask, requests), and importing must not
+# create files or directories.
+#
+# Usage:
+#     python benchmarks/bench_import_time.py [--runs N]
+# Exits with status 1 if any budget or check fails.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> budget in seconds (None = measured only)
+BUDGETS = {
+    'process': 1.0,
+    'top_stocks': 1.0,
+    'download_info': 1.0,
+    'fast_sim': 1.0,
+    'batch_runner': 1.2,
+    'app': None
+}
+
+# Modules that must not be imported as a side effect of the simulation-only path
+HEAVY_MODULES = ['matplotlib', 'flask', 'requests']
+SIMULATION_MODULES = ['process', 'top_stocks', 'download_info', 'fast_sim', 'batch_runner']
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, runs):
+    # Best-of-N import time in a clean interpreter, plus the heavy modules it loaded
+    best = None
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    runs = int(argv[argv.index('--runs') + 1]) if '--runs' in argv else 3
+    failures = []
+
+    entries_before = set(os.listdir(REPO_DIR))
+    for module, budget in BUDGETS.items():
+        result = measure(module, runs)
+        status = 'ok'
+        if budget is not None and result['seconds'] > budget:
+            status = f"over budget ({budget:.2f}s)"
+            failures.append(module)
+        if module in SIMULATION_MODULES and result['heavy']:
+            status = f"imports {', '.join(result['heavy'])}"
+            failures.append(module)
+        print(f"{module:15s} {result['seconds']:.3f}s  {status}")
+
+    created = set(os.listdir(REPO_DIR)) - entries_before - {'__pycache__'}
+    if created:
+        print(f"Importing created: {', '.join(sorted(created))}")
+        failures.append('side effects')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
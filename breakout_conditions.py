@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+# Breakout conditions that suspend trading around major events.
+#
+# Each condition is evaluated once over the whole period as a boolean
+# (dates x tickers) DataFrame, where True means "suspended on this date".
+# Conditions only look at data on or before each date, so there is no lookahead.
+#
+# A condition's action decides how the mask is used by process.process:
+#   'block' - candidate buys of that ticker are skipped on suspended dates
+#   'exit'  - open positions in that ticker are sold on suspended dates (and buys are blocked)
+#
+# The masks do not depend on the strategy parameters, so a parameter sweep builds
+# them once, converts them once with mask_to_lookup and passes the lookups to every
+# simulation (process.process accepts a lookup in place of a mask).
+
+ACTIONS = ['block', 'exit']
+
+
+def breakout_condition(condition_type, action='block', **params):
+    """
+    Declares a breakout condition.
+
+    Args:
+        condition_type (str): One of CONDITION_TYPES.
+        action (str): 'block' or 'exit'.
+        **params: Parameters for the condition function (e.g. days=5, threshold=0.1).
+
+    Returns:
+        dict: The condition, usable in build_masks.
+    """
+    if condition_type not in CONDITION_TYPES:
+        raise ValueError(f"Unknown condition '{condition_type}', expected one of {list(CONDITION_TYPES)}")
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action '{action}', expected one of {ACTIONS}")
+    return {'type': condition_type, 'action': action, 'params': params}
+
+
+def price_frames(downloaded_data, start_date, end_date):
+    """
+    Builds the price matrices the conditions work on.
+
+    Returns:
+        tuple: (raw, daily) DataFrames of adjusted_close with tickers as columns.
+            raw has one row per day on which any ticker traded (NaN where a ticker did not),
+            daily is forward-filled over every calendar day from start_date to end_date.
+    """
+    full_date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+    raw = pd.DataFrame({
+        ticker: data['prices']['adjusted_close']
+        for ticker, data in downloaded_data.items() if not data['prices'].empty
+    })
+    raw = raw.reindex(columns=list(downloaded_data.keys())).sort_index()
+    raw = raw.loc[(raw.index >= full_date_range[0]) & (raw.index <= full_date_range[-1])]
+    daily = raw.reindex(full_date_range).ffill()
+    return raw, daily
+
+
+def price_drop(raw, daily, days=5, threshold=0.10):
+    # Price has fallen by at least `threshold` over the last `days` calendar days
+    change = daily / daily.shift(days) - 1
+    return change <= -threshold
+
+
+def volatility_spike(raw, daily, window=20, baseline=250, multiple=2.0):
+    # Short-window volatility of trading-day returns is `multiple` times its long-run level
+    returns = raw.pct_change(fill_method=None)
+    short_vol = returns.rolling(window, min_periods=max(2, window // 2)).std()
+    long_vol = returns.rolling(baseline, min_periods=max(2, baseline // 4)).std()
+    spike = (short_vol > multiple * long_vol).astype(float)
+    return spike.reindex(daily.index).ffill().fillna(0).astype(bool)
+
+
+def market_drawdown(raw, daily, threshold=0.15, window=250):
+    # Equal-weighted market index is at least `threshold` below its rolling high; applies to all tickers
+    market_returns = raw.pct_change(fill_method=None).mean(axis=1).fillna(0)
+    market_index = (1 + market_returns).cumprod()
+    drawdown = 1 - market_index / market_index.rolling(window, min_periods=1).max()
+    in_drawdown = (drawdown >= threshold).astype(float).reindex(daily.index).ffill().fillna(0).astype(bool)
+    return pd.DataFrame(np.repeat(in_drawdown.to_numpy()[:, np.newaxis], daily.shape[1], axis=1),
+                        index=daily.index, columns=daily.columns)
+
+
+def data_gap(raw, daily, max_gap_days=7):
+    # More than `max_gap_days` calendar days since the ticker's last real price (or no price yet)
+    dates = pd.Series(raw.index, index=raw.index)
+    last_seen = pd.DataFrame({ticker: dates.where(raw[ticker].notna()) for ticker in raw.columns}, index=raw.index)
+    last_seen = last_seen.reindex(daily.index).ffill()
+    days_since = last_seen.rsub(pd.Series(daily.index, index=daily.index), axis=0)
+    return days_since.isna() | (days_since > pd.Timedelta(days=max_gap_days))
+
+
+def blackout(raw, daily, periods=(), tickers=None):
+    # Manual blackout periods, given as dates or (start, end) pairs, for some or all tickers
+    mask = pd.DataFrame(False, index=daily.index, columns=daily.columns)
+    columns = list(daily.columns) if tickers is None else [t for t in tickers if t in daily.columns]
+    for period in periods:
+        start, end = period if isinstance(period, (tuple, list)) else (period, period)
+        mask.loc[pd.Timestamp(start):pd.Timestamp(end), columns] = True
+    return mask
+
+
+CONDITION_TYPES = {
+    'price_drop': price_drop,
+    'volatility_spike': volatility_spike,
+    'market_drawdown': market_drawdown,
+    'data_gap': data_gap,
+    'blackout': blackout
+}
+
+
+def build_masks(downloaded_data, conditions, start_date, end_date):
+    """
+    Evaluates breakout conditions into combined masks.
+
+    Args:
+        downloaded_data (dict): Dictionary containing the stock data.
+        conditions (list): Conditions from breakout_condition.
+        start_date, end_date: Period to evaluate.
+
+    Returns:
+        tuple: (block_mask, exit_mask) boolean DataFrames (dates x tickers).
+            Exit conditions are included in block_mask as well.
+    """
+    raw, daily = price_frames(downloaded_data, start_date, end_date)
+    block_mask = pd.DataFrame(False, index=daily.index, columns=daily.columns)
+    exit_mask = block_mask.copy()
+
+    for condition in conditions:
+        mask = CONDITION_TYPES[condition['type']](raw, daily, **condition['params'])
+        mask = mask.reindex(index=daily.index, columns=daily.columns, fill_value=False).astype(bool)
+        block_mask |= mask
+        if condition['action'] == 'exit':
+            exit_mask |= mask
+        print(f"Breakout condition {condition['type']} ({condition['action']}): {int(mask.to_numpy().sum())} suspended ticker-days")
+
+    return block_mask, exit_mask
+
+
+class MaskLookup(dict):
+    """
+    {date: set of suspended tickers} built from a mask by mask_to_lookup, keeping only
+    dates with at least one suspension. The mask it came from is kept as .mask (None
+    for no mask), for code that needs the whole matrix.
+    """
+
+    def __init__(self, lookup, mask):
+        super().__init__(lookup)
+        self.mask = mask
+
+
+def mask_to_lookup(mask):
+    """
+    Converts a mask into a MaskLookup, so the simulation loop does a single dictionary
+    lookup per day. A MaskLookup is returned as it is, so a sweep converts each mask once.
+    """
+    if isinstance(mask, MaskLookup):
+        return mask
+    if mask is None:
+        return MaskLookup({}, None)
+    values = mask.to_numpy()
+    columns = np.asarray(mask.columns, dtype=object)
+    rows = np.flatnonzero(values.any(axis=1))
+    return MaskLookup({mask.index[row]: set(columns[values[row]]) for row in rows}, mask)
+
+
+def as_mask(mask):
+    # The mask DataFrame of a mask or a MaskLookup (None for no mask)
+    return mask.mask if isinstance(mask, MaskLookup) else mask
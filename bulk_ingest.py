@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+                                    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday)
+
+import download_info as di
+import panel_store as ps
+
+# Bulk end-of-day ingestion into a panel store.
+#
+# Instead of one request per ticker, each trading day is fetched with a single
+# exchange-wide bulk request (prices and market caps for every symbol), plus one
+# bulk dividends and one bulk splits request per day and one earnings calendar
+# request for the whole range. Only the days after the last one in the store are
+# requested, so a daily refresh is a handful of API calls whatever the size of the
+# universe.
+#
+# Per-ticker history (download_info.download_data) is only used to backfill: when a
+# store is created, when tickers are added to it, and when a split or dividend
+# changes a ticker's adjusted closes. Adjusted closes are re-based backwards on every
+# such event, so the stored history of that ticker is downloaded again (already
+# re-based by the API) rather than mixing old and new adjustments.
+#
+# A weekday without bulk data is only passed over if it is a known holiday of the
+# exchange (see exchange_holidays); otherwise the update stops there, so a day that
+# was not published yet is fetched again on the next update instead of being lost.
+#
+# Requests go through download_info.download_and_cache_json, so bulk files are cached
+# like every other response (except empty or stale bulk days, which are asked for
+# again), and download_info.API_BASE_URL can point at a local stand-in server (see
+# serve_recorded_bulk) for testing.
+
+DEFAULT_EXCHANGE = 'US'
+
+# Unscheduled US market closures (the regular holidays are in USMarketHolidayCalendar)
+US_SPECIAL_CLOSURES = ['2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14', '2004-06-11', '2007-01-02',
+                       '2012-10-29', '2012-10-30', '2018-12-05', '2025-01-09']
+
+
+class USMarketHolidayCalendar(AbstractHolidayCalendar):
+    # Regular NYSE/NASDAQ holidays. New Year's Day on a Saturday is not observed on the Friday.
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas Day', month=12, day=25, observance=nearest_workday)
+    ]
+
+
+def exchange_holidays(exchange, start_date, end_date):
+    # Known weekday holidays of an exchange between two dates (only 'US' is known)
+    if exchange != 'US':
+        return pd.DatetimeIndex([])
+    holidays = USMarketHolidayCalendar().holidays(start_date, end_date)
+    special = pd.DatetimeIndex(US_SPECIAL_CLOSURES)
+    return holidays.union(special[(special >= pd.Timestamp(start_date)) & (special <= pd.Timestamp(end_date))])
+
+
+def _records(data):
+    # Bulk endpoints return a list of records; anything else means "no data"
+    return data if isinstance(data, list) else []
+
+
+def fetch_bulk_day(exchange, date, api_key):
+    """
+    Fetches adjusted close and market cap for every symbol of an exchange on one day.
+
+    Returns:
+        tuple: ({ticker: (adjusted_close, market_cap)}, status_code). The dict is empty
+            on non-trading days.
+    """
+    url = f"{di.API_BASE_URL}/eod-bulk-last-day/{exchange}?api_token={api_key}&date={date}&filter=extended&fmt=json"
+    data, status_code = di.download_and_cache_json(url)
+
+    values = {}
+    for record in _records(data):
+        if 'code' not in record or record.get('date') != date:
+            continue  # Skip symbols whose last quote is from an earlier day
+        market_cap = record.get('MarketCapitalization', record.get('market_capitalization'))
+        values[f"{record['code']}.{exchange}"] = (
+            float(record.get('adjusted_close', np.nan) or np.nan),
+            float(market_cap) if market_cap not in (None, '') else np.nan
+        )
+
+    # An empty or stale answer (the day is not published yet, or a holiday) must not stay
+    # in the cache, or the day could never be fetched again
+    cache_file = di.cache_file_for_url(url)
+    if not values and cache_file and os.path.exists(cache_file):
+        os.remove(cache_file)
+    return values, status_code
+
+
+def fetch_bulk_events(exchange, date, api_key, event_type):
+    # {ticker: [event date]} for every symbol of an exchange with a 'dividends' or 'splits' event on one day
+    url = f"{di.API_BASE_URL}/eod-bulk-last-day/{exchange}?api_token={api_key}&date={date}&type={event_type}&fmt=json"
+    data, status_code = di.download_and_cache_json(url)
+    events = {}
+    for record in _records(data):
+        if 'code' in record and 'date' in record:
+            events.setdefault(f"{record['code']}.{exchange}", []).append(pd.to_datetime(record['date']))
+    return events, status_code
+
+
+def fetch_bulk_dividends(exchange, date, api_key):
+    # {ticker: [ex-dividend date]} for every symbol of an exchange going ex-dividend on one day
+    return fetch_bulk_events(exchange, date, api_key, 'dividends')
+
+
+def fetch_bulk_splits(exchange, date, api_key):
+    # {ticker: [split date]} for every symbol of an exchange splitting on one day
+    return fetch_bulk_events(exchange, date, api_key, 'splits')
+
+
+def fetch_bulk_earnings(exchange, start_date, end_date, api_key):
+    # {ticker: [report date]} for every symbol of an exchange reporting between two dates
+    url = f"{di.API_BASE_URL}/calendar/earnings?api_token={api_key}&from={start_date}&to={end_date}&fmt=json"
+    data, status_code = di.download_and_cache_json(url)
+    earnings = {}
+    if status_code == 200 and data:
+        for item in data.get('earnings', []):
+            code = item.get('code', '')
+            if code.endswith(f".{exchange}") and 'report_date' in item:
+                earnings.setdefault(code, []).append(pd.to_datetime(item['report_date']))
+    return earnings, status_code
+
+
+def create_store(store_dir, api_key, tickers, start_date, end_date):
+    """
+    Creates a panel store by backfilling each ticker's history one ticker at a time.
+    """
+    downloaded_data = di.download_data(api_key, tickers, start_date, end_date)
+    return ps.build_panel_store(downloaded_data, store_dir)
+
+
+def add_tickers(store_dir, api_key, tickers, start_date=None, end_date=None):
+    """
+    Adds tickers to an existing store, backfilling their history per ticker.
+
+    Field files are stored row by row, so new columns mean rewriting the store; this
+    is only needed when the universe changes, not on daily updates.
+    """
+    store = ps.PanelStore(store_dir)
+    new_tickers = [ticker for ticker in tickers if ticker not in store.ticker_index]
+    if not new_tickers:
+        return store
+
+    dates = store.dates
+    start_date = start_date or (dates[0].strftime('%Y-%m-%d') if len(dates) else None)
+    end_date = end_date or (dates[-1].strftime('%Y-%m-%d') if len(dates) else None)
+    downloaded_data = store.to_downloaded_data()
+    downloaded_data.update(di.download_data(api_key, new_tickers, start_date, end_date))
+    del store
+    return ps.build_panel_store(downloaded_data, store_dir)
+
+
+def update_store(store_dir, api_key, end_date=None, exchange=DEFAULT_EXCHANGE, max_days=None, holidays=None):
+    """
+    Brings a panel store up to date with bulk daily downloads.
+
+    Args:
+        store_dir (str): Existing panel store.
+        api_key (str): EODHD API key.
+        end_date (str): Last day to fetch (default: yesterday, so no partial day is cached).
+        exchange (str): Exchange code for the bulk endpoints.
+        max_days (int): Optional limit on the number of days fetched in one call.
+        holidays (list-like): Extra days the exchange was closed, on top of
+            exchange_holidays (needed for exchanges other than 'US').
+
+    Returns:
+        dict: Number of requests made, trading days appended, holidays skipped, the
+            tickers whose history was re-based, and the first day without data that is
+            not a known holiday (pending, fetched again on the next update) or None.
+    """
+    store = ps.PanelStore(store_dir)
+    tickers = store.tickers
+    ticker_index = store.ticker_index
+    stored_dates = store.dates
+    del store
+
+    end = pd.Timestamp(end_date) if end_date else pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    if len(stored_dates) == 0:
+        raise ValueError("The store is empty; create it with create_store first")
+    candidate_days = pd.bdate_range(stored_dates[-1] + pd.Timedelta(days=1), end)
+    if max_days is not None:
+        candidate_days = candidate_days[:max_days]
+    known_holidays = exchange_holidays(exchange, stored_dates[-1], end)
+    if holidays is not None:
+        known_holidays = known_holidays.union(pd.DatetimeIndex(pd.to_datetime(list(holidays))))
+
+    requests_made = 0
+    new_dates = []
+    rows = {'adjusted_close': [], 'market_cap': []}
+    new_dividends = {}
+    rebase_tickers = set()  # Tickers with a split or dividend on a new day
+    rebased = {}
+    skipped = []
+    pending = None
+
+    for day in candidate_days:
+        date_str = day.strftime('%Y-%m-%d')
+        values, status_code = fetch_bulk_day(exchange, date_str, api_key)
+        requests_made += 1
+        if status_code != 200 or not values:
+            if day in known_holidays:
+                print(f"No bulk data for {exchange} on {date_str} (holiday), skipping.")
+                skipped.append(date_str)
+                continue
+            # Not published yet, or a failed request: later days must not be appended
+            # before it, so stop and fetch it again on the next update
+            print(f"No bulk data for {exchange} on {date_str} (status {status_code}), stopping until it is available.")
+            pending = date_str
+            break
+
+        price_row = np.full(len(tickers), np.nan)
+        cap_row = np.full(len(tickers), np.nan)
+        for ticker, (adjusted_close, market_cap) in values.items():
+            j = ticker_index.get(ticker)
+            if j is not None:
+                price_row[j] = adjusted_close
+                cap_row[j] = market_cap
+        new_dates.append(day)
+        rows['adjusted_close'].append(price_row)
+        rows['market_cap'].append(cap_row)
+
+        dividends, _ = fetch_bulk_dividends(exchange, date_str, api_key)
+        splits, _ = fetch_bulk_splits(exchange, date_str, api_key)
+        requests_made += 2
+        for ticker, dates in dividends.items():
+            if ticker in ticker_index:
+                new_dividends.setdefault(ticker, []).extend(dates)
+                rebase_tickers.add(ticker)
+        rebase_tickers.update(ticker for ticker in splits if ticker in ticker_index)
+
+    if new_dates:
+        prices = np.vstack(rows['adjusted_close'])
+
+        # A split or dividend re-bases all earlier adjusted closes of the ticker, so its
+        # history is downloaded again and replaces the stored column
+        history_start = stored_dates[0].strftime('%Y-%m-%d')
+        history_end = new_dates[-1].strftime('%Y-%m-%d')
+        for ticker in sorted(rebase_tickers):
+            history, status_code = di.fetch_price_data(ticker, history_start, history_end, api_key)
+            requests_made += 1
+            if status_code != 200 or history.empty:
+                print(f"Could not download the history of {ticker} (status {status_code}); its earlier adjusted closes are not re-based.")
+                continue
+            history = history['adjusted_close']
+            rebased[ticker] = history.reindex(stored_dates).to_numpy(dtype=np.float64)
+            new_values = history.reindex(pd.DatetimeIndex(new_dates))
+            j = ticker_index[ticker]
+            prices[:, j] = np.where(new_values.isna(), prices[:, j], new_values.to_numpy(dtype=np.float64))
+
+        # Earnings are announced ahead of time, so refresh a window reaching past the new days
+        earnings, _ = fetch_bulk_earnings(exchange, new_dates[0].strftime('%Y-%m-%d'),
+                                          (new_dates[-1] + pd.DateOffset(months=6)).strftime('%Y-%m-%d'), api_key)
+        requests_made += 1
+
+        # The new days are appended last: if the update is interrupted before, the same
+        # days are fetched again next time (re-basing and merging events again is harmless)
+        ps.update_columns(store_dir, 'adjusted_close', rebased)
+        ps.append_events(store_dir, 'dividends', new_dividends)
+        ps.append_events(store_dir, 'earnings_dates', {ticker: dates for ticker, dates in earnings.items() if ticker in ticker_index})
+        ps.append_trading_days(store_dir, new_dates, {'adjusted_close': prices, 'market_cap': np.vstack(rows['market_cap'])})
+
+    print(f"Bulk update: {len(new_dates)} trading days appended, {len(skipped)} holidays skipped, "
+          f"{len(rebased)} tickers re-based, {requests_made} requests."
+          + (f" Waiting for {pending}." if pending else ""))
+    return {'requests': requests_made, 'appended': len(new_dates), 'skipped': skipped,
+            'rebased': sorted(rebased), 'pending': pending}
+
+
+def serve_recorded_bulk(directory, port=8000):
+    """
+    Serves recorded API responses from a directory as a local stand-in for the EODHD API.
+
+    Layout (all JSON):
+        <directory>/eod-bulk-last-day/<EXCHANGE>/<date>.json             bulk prices
+        <directory>/eod-bulk-last-day/<EXCHANGE>/dividends/<date>.json   bulk dividends
+        <directory>/eod-bulk-last-day/<EXCHANGE>/splits/<date>.json      bulk splits
+        <directory>/calendar/earnings.json                               earnings calendar
+        <directory>/<endpoint>/<TICKER>.json                             per-ticker history (eod, div, historical-market-cap)
+
+    Missing bulk days are answered with an empty list, like a market holiday, and
+    per-ticker history is cut to the requested from/to dates. Set download_info.API_BASE_URL
+    to f"http://127.0.0.1:{port}/api" to use it (port 0 picks a free port, see
+    server.server_address).
+
+    Returns:
+        http.server.HTTPServer: Call serve_forever() (e.g. in a thread) and shutdown().
+    """
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+    class RecordedBulkHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            parts = url.path.strip('/').split('/')[1:]  # Drop the leading 'api'
+
+            body = None
+            if parts[:1] == ['eod-bulk-last-day'] and len(parts) == 2:
+                sub_dir = [query['type']] if query.get('type') in ('dividends', 'splits') else []
+                path = os.path.join(directory, 'eod-bulk-last-day', parts[1], *sub_dir, f"{query.get('date')}.json")
+                body = _read_json(path, default=[])
+            elif parts == ['calendar', 'earnings']:
+                body = _read_json(os.path.join(directory, 'calendar', 'earnings.json'), default={'earnings': []})
+                start, end = query.get('from', ''), query.get('to', '9999-12-31')
+                body = {'earnings': [item for item in body.get('earnings', [])
+                                     if start <= item.get('report_date', '') <= end
+                                     and query.get('symbols', item.get('code')) == item.get('code')]}
+            elif len(parts) == 2:
+                body = _read_json(os.path.join(directory, parts[0], f"{parts[1]}.json"))
+                start, end = query.get('from', ''), query.get('to', '9999-12-31')
+                if isinstance(body, list):
+                    body = [item for item in body if start <= item.get('date', '') <= end]
+                elif isinstance(body, dict):
+                    body = {key: item for key, item in body.items() if start <= item.get('date', '') <= end}
+
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # Keep test output quiet
+
+    return HTTPServer(('127.0.0.1', port), RecordedBulkHandler)
+
+
+def _read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update a panel store with bulk end-of-day downloads.")
+    parser.add_argument('store', help="Panel store directory")
+    parser.add_argument('--api-key', default=os.environ.get('EODHD_API_KEY'), help="EODHD API key (default: $EODHD_API_KEY)")
+    parser.add_argument('--exchange', default=DEFAULT_EXCHANGE)
+    parser.add_argument('--end-date', help="Last day to fetch (default: yesterday)")
+    parser.add_argument('--create', metavar='TICKERS', help="Create the store first, backfilling these comma-separated tickers")
+    parser.add_argument('--start-date', help="Backfill start date (with --create)")
+    parser.add_argument('--base-url', help="API base URL (e.g. a local stand-in server)")
+    parser.add_argument('--holidays', help="Comma-separated extra days the exchange was closed (needed outside the US)")
+    args = parser.parse_args(argv)
+    if args.create and not (args.start_date and args.end_date):
+        parser.error("--create needs --start-date and --end-date")
+
+    if args.base_url:
+        di.API_BASE_URL = args.base_url
+    if args.create:
+        create_store(args.store, args.api_key, args.create.split(','), args.start_date, args.end_date)
+    else:
+        update_store(args.store, args.api_key, args.end_date, args.exchange,
+                     holidays=args.holidays.split(',') if args.holidays else None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
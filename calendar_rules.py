@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+# Entry/exit calendar engine.
+#
+# A rule says which reference dates trigger a trade and how to move from the
+# reference date to an actual trading day:
+#   anchor  - 'ex_dividend', 'earnings', 'year_start', 'quarter_start',
+#             'month_start', 'week_start' or 'daily'
+#   offset  - number of days to add to the anchor date (negative = before)
+#   unit    - 'calendar' (plain days) or 'trading' (days the ticker has a price)
+#   roll    - what to do when the result is not a trading day: 'following' moves
+#             to the next price, 'preceding' to the previous one, 'none' drops it
+#
+# Rules are compiled once per ticker into sorted (buy date, sell date) arrays, so
+# the simulation loop only ever does a dictionary lookup per day.
+
+ANCHORS = ['ex_dividend', 'earnings', 'year_start', 'quarter_start', 'month_start', 'week_start', 'daily']
+UNITS = ['calendar', 'trading']
+ROLLS = ['following', 'preceding', 'none']
+
+# pandas frequencies for the anchors that do not come from the downloaded events
+CALENDAR_ANCHOR_FREQS = {
+    'year_start': 'YS',
+    'quarter_start': 'QS',
+    'month_start': 'MS',
+    'week_start': 'W-MON',
+    'daily': 'D'
+}
+
+
+def calendar_rule(anchor, offset=0, unit='calendar', roll='following'):
+    """
+    Declares an entry or exit rule.
+
+    Args:
+        anchor (str): Reference event, one of ANCHORS.
+        offset (int): Days to add to the reference date (negative = before).
+        unit (str): 'calendar' or 'trading' days for the offset.
+        roll (str): 'following', 'preceding' or 'none' for non-trading days.
+
+    Returns:
+        dict: The rule, usable as entry_rule/exit_rule in process.process.
+    """
+    if anchor not in ANCHORS:
+        raise ValueError(f"Unknown anchor '{anchor}', expected one of {ANCHORS}")
+    if unit not in UNITS:
+        raise ValueError(f"Unknown unit '{unit}', expected one of {UNITS}")
+    if roll not in ROLLS:
+        raise ValueError(f"Unknown roll '{roll}', expected one of {ROLLS}")
+    return {'anchor': anchor, 'offset': int(offset), 'unit': unit, 'roll': roll}
+
+
+def default_rules(days_after_dividend, days_before_earnings):
+    # The original strategy: buy after the ex-dividend date, sell before the next earnings.
+    # The exit rolls back to the previous price, so a sell date on a weekend or holiday
+    # never moves onto or past the earnings date (and sells at the same price as the
+    # forward-filled original)
+    entry_rule = calendar_rule('ex_dividend', days_after_dividend)
+    exit_rule = calendar_rule('earnings', -days_before_earnings, roll='preceding')
+    return entry_rule, exit_rule
+
+
+def trading_days_for(data):
+    # Sorted datetime64[ns] array of the days on which a ticker actually has a price
+    prices = data['prices']
+    if prices.empty:
+        return np.array([], dtype='datetime64[ns]')
+    valid = prices.index[prices['adjusted_close'].notna().to_numpy()]
+    return np.unique(pd.DatetimeIndex(valid).values.astype('datetime64[ns]'))
+
+
+def anchor_dates(data, anchor, start_date, end_date):
+    # Sorted datetime64[ns] array of the reference dates for one ticker
+    if anchor == 'ex_dividend':
+        dates = data.get('dividends', [])
+    elif anchor == 'earnings':
+        dates = data.get('earnings_dates', [])
+    else:
+        dates = pd.date_range(start=start_date, end=end_date, freq=CALENDAR_ANCHOR_FREQS[anchor])
+
+    if len(dates) == 0:
+        return np.array([], dtype='datetime64[ns]')
+    return np.unique(pd.DatetimeIndex(dates).values.astype('datetime64[ns]'))
+
+
+def apply_rule(dates, rule, trading_days):
+    """
+    Moves reference dates onto trading days according to a rule.
+
+    Args:
+        dates (np.ndarray): datetime64[ns] reference dates.
+        rule (dict): Rule from calendar_rule.
+        trading_days (np.ndarray): Sorted datetime64[ns] trading days of the ticker.
+
+    Returns:
+        tuple: (rolled dates, boolean mask of which input dates produced a valid day)
+    """
+    num_days = len(trading_days)
+    if num_days == 0 or len(dates) == 0:
+        return np.array([], dtype='datetime64[ns]'), np.zeros(len(dates), dtype=bool)
+
+    if rule['unit'] == 'calendar':
+        targets = dates + np.timedelta64(rule['offset'], 'D')
+        positions, valid = _roll(targets, rule['roll'], trading_days)
+    else:
+        # Roll the anchor onto the trading calendar first, then count trading days
+        positions, valid = _roll(dates, rule['roll'], trading_days)
+        positions = positions + rule['offset']
+        valid &= (positions >= 0) & (positions < num_days)
+
+    positions = np.clip(positions, 0, num_days - 1)
+    return trading_days[positions[valid]], valid
+
+
+def _roll(targets, roll, trading_days):
+    # Index into trading_days for each target, plus a mask of which ones are usable
+    num_days = len(trading_days)
+    if roll == 'preceding':
+        positions = np.searchsorted(trading_days, targets, side='right') - 1
+        valid = positions >= 0
+    else:
+        positions = np.searchsorted(trading_days, targets, side='left')
+        valid = positions < num_days
+        if roll == 'none':
+            exact = trading_days[np.clip(positions, 0, num_days - 1)] == targets
+            valid &= exact
+    return positions, valid
+
+
+def compile_trade_schedule(downloaded_data, entry_rule, exit_rule, start_date, end_date):
+    """
+    Compiles entry and exit rules into per-ticker trade arrays.
+
+    Every entry date is paired with the first exit anchor strictly after it, shifted
+    and rolled by the exit rule. Trades whose sell date is not after the buy date, or
+    that fall outside start_date..end_date, are dropped.
+
+    Returns:
+        dict: ticker -> (buy dates, sell dates), both sorted datetime64[ns] arrays.
+    """
+    start = np.datetime64(pd.Timestamp(start_date), 'ns')
+    end = np.datetime64(pd.Timestamp(end_date), 'ns')
+    schedule = {}
+
+    for ticker, data in downloaded_data.items():
+        trading_days = trading_days_for(data)
+
+        entries = anchor_dates(data, entry_rule['anchor'], start_date, end_date)
+        buy_dates, _ = apply_rule(entries, entry_rule, trading_days)
+        buy_dates = np.unique(buy_dates)
+
+        exit_anchors = anchor_dates(data, exit_rule['anchor'], start_date, end_date)
+        next_exit = np.searchsorted(exit_anchors, buy_dates, side='right')
+        has_exit = next_exit < len(exit_anchors)
+        buy_dates = buy_dates[has_exit]
+        sell_dates, valid = apply_rule(exit_anchors[next_exit[has_exit]], exit_rule, trading_days)
+        buy_dates = buy_dates[valid]
+
+        keep = (sell_dates > buy_dates) & (buy_dates >= start) & (sell_dates <= end)
+        schedule[ticker] = (buy_dates[keep], sell_dates[keep])
+
+    return schedule
+
+
+def schedule_by_date(schedule):
+    """
+    Turns a compiled schedule into {buy date: [(ticker, sell date), ...]} for the
+    simulation loop. Tickers keep the order of the schedule on each date.
+    """
+    trades_by_date = {}
+    for ticker, (buy_dates, sell_dates) in schedule.items():
+        for buy_date, sell_date in zip(pd.DatetimeIndex(buy_dates), pd.DatetimeIndex(sell_dates)):
+            trades_by_date.setdefault(buy_date, []).append((ticker, sell_date))
+    return trades_by_date
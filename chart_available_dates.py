@@ -1,11 +1,11 @@
-from io import BytesIO
-import base64
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import pandas as pd
 
+import chart_utils as cu
+
 # Function to plot date ranges for each stock, showing dividends, earnings, and prices with markers
 def plot_stock_date_ranges(downloaded_data):
+    plt = cu.pyplot()
+    import matplotlib.dates as mdates
 
     # Scale the height of the plot based on the number of tickers
     num_tickers = len(downloaded_data)
@@ -81,9 +81,5 @@ def plot_stock_date_ranges(downloaded_data):
     plt.xticks(rotation=45)
     plt.tight_layout()
 
-    # Save the plot to a BytesIO object
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    # Convert plot to base64 string
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    # Save the plot and convert it to a base64 string
+    return cu.figure_to_base64(plt)
@@ -1,11 +1,6 @@
-from io import BytesIO
-import base64
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 
-
-import matplotlib.dates as mdates
+import chart_utils as cu
 
 def chart_free_capital_errors(free_capital_errors, start_date, end_date):
     """
@@ -23,6 +18,9 @@ def chart_free_capital_errors(free_capital_errors, start_date, end_date):
     if len(free_capital_errors) == 0:
         return None
 
+    plt = cu.pyplot()
+    import matplotlib.dates as mdates
+
     # Create a DataFrame from the list of errors
     df_errors = pd.DataFrame(free_capital_errors, columns=['Ticker', 'Date'])
     df_errors['Date'] = pd.to_datetime(df_errors['Date'])
@@ -66,16 +64,14 @@ def chart_free_capital_errors(free_capital_errors, start_date, end_date):
     # Adjust the layout
     plt.tight_layout()
 
-    # Save the plot to a BytesIO object
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    # Convert plot to base64 string
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    # Save the plot and convert it to a base64 string
+    return cu.figure_to_base64(plt)
 
 
 
 def chart_combined(investment_results, metrics):
+    plt = cu.pyplot()
+
     # Convert the investment_results dictionary to a DataFrame
     df = pd.DataFrame(investment_results).T  # Transpose to get dates as rows
     
@@ -148,9 +144,5 @@ def chart_combined(investment_results, metrics):
 
     plt.tight_layout(rect=[0, 0.1, 1, 0.95])  # Adjust layout to make room for the text and rotated labels
     
-    # Save the plot to a BytesIO object
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    # Convert plot to base64 string
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
\ No newline at end of file
+    # Save the plot and convert it to a base64 string
+    return cu.figure_to_base64(plt)
\ No newline at end of file
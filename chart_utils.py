@@ -0,0 +1,22 @@
+from io import BytesIO
+import base64
+
+# Shared helpers for the chart modules. matplotlib is only imported the first time a
+# chart is actually rendered, so the simulation, batch and web worker start-up paths
+# do not pay for it.
+
+
+def pyplot():
+    # Import pyplot on demand, with a non-interactive backend (for PNGs)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def figure_to_base64(plt):
+    # Save the current figure to a BytesIO object and convert it to a base64 string
+    buf = BytesIO()
+    plt.savefig(buf, format="png")
+    buf.seek(0)
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
@@ -1,14 +1,23 @@
 import os
-import hashlib
-import requests
 import pandas as pd
 import io
 import json
 import re
+import time
+import threading
+import contextlib
 
-# Create a directory for caching
+try:
+    import fcntl  # File locks on Linux/macOS
+except ImportError:
+    fcntl = None
+    import msvcrt  # File locks on Windows
+
+# Directory for caching (created on the first download, not at import)
 CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Base URL of the EODHD API (can be pointed at a local stand-in server for testing)
+API_BASE_URL = "https://eodhd.com/api"
 
 # Helper function to extract the API endpoint, ticker, and api_token from the URL
 def extract_info_from_url(url):
@@ -32,20 +41,123 @@ def extract_info_from_url(url):
     
     return api_path, ticker, api_token
 
-# Helper function to download data and cache it
-def download_and_cache_json(url, cache_dir=CACHE_DIR):
+# Helper functions for an exclusive lock on a file, shared by threads and processes
+# (web workers, prefetch.py), e.g. so that only one of them downloads a cache file
+def _try_lock(f):
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+@contextlib.contextmanager
+def file_lock(lock_file, wait_message=None):
+    # Holds the lock on lock_file for the with block, printing wait_message if another
+    # thread or process holds it first. The lock file itself is never removed
+    with open(lock_file, 'a+b') as f:
+        if not _try_lock(f):
+            if wait_message:
+                print(wait_message)
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                while not _try_lock(f):
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _modified_time(path):
+    # Modification time in nanoseconds (None if the file does not exist)
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+# Helper function to read a cached response (None if missing or unreadable)
+def read_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, 'r') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # Left by an interrupted write before writes were atomic; download it again
+        print(f"Ignoring unreadable cache file: {cache_file}")
+        return None
+    print(f"Loading from cache: {cache_file}")
+    return data
+
+# Helper function to write a response to the cache atomically: readers see either
+# no file or the complete file, never a partly written one
+def write_cache(cache_file, data):
+    tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+# Cache hits and misses per ticker, saved to ACCESS_STATS_FILE by save_access_stats
+# (the prefetcher uses them to warm the most used tickers first)
+ACCESS_STATS_FILE = os.path.join(CACHE_DIR, "access_stats.json")
+_access_counts = {}
+_access_counts_lock = threading.Lock()
+
+def record_access(ticker, hit):
+    with _access_counts_lock:
+        counts = _access_counts.setdefault(ticker, {'hits': 0, 'misses': 0, 'last_access': None})
+        counts['hits' if hit else 'misses'] += 1
+        counts['last_access'] = pd.Timestamp.now().isoformat(timespec='seconds')
+
+def load_access_stats(stats_file=None):
+    # {ticker: {'hits', 'misses', 'last_access'}} from the stats file
+    stats_file = stats_file or ACCESS_STATS_FILE
+    if not os.path.exists(stats_file):
+        return {}
+    with open(stats_file, 'r') as f:
+        return json.load(f)
+
+def save_access_stats(stats_file=None):
+    # Adds the counts since the last save to the stats file
+    stats_file = stats_file or ACCESS_STATS_FILE
+    with _access_counts_lock:
+        if not _access_counts:
+            return
+        counts = dict(_access_counts)
+        _access_counts.clear()
+        os.makedirs(os.path.dirname(stats_file) or '.', exist_ok=True)
+        # Other processes (web workers, prefetch.py) update the same file
+        with file_lock(f"{stats_file}.lock"):
+            stats = load_access_stats(stats_file)
+            for ticker, new in counts.items():
+                old = stats.setdefault(ticker, {'hits': 0, 'misses': 0, 'last_access': None})
+                old['hits'] += new['hits']
+                old['misses'] += new['misses']
+                old['last_access'] = new['last_access']
+            write_cache(stats_file, stats)
+
+# Helper function to get the cache file of a URL (None if the URL has no ticker)
+def cache_file_for_url(url, cache_dir=CACHE_DIR):
     # Extract the API path, ticker, and api_token from the URL
     api_path, ticker, api_token = extract_info_from_url(url)
-    
-    # Ensure that the ticker is properly identified, otherwise skip caching
     if ticker == "unknown":
-        print(f"Warning: Ticker not found in URL {url}. Skipping cache.")
-        return None, 404  # Return None and a status code indicating "Not Found"
-    
-    # Create subfolder for the ticker first, then the api_path (e.g., eod, calendar_earnings)
-    ticker_dir = os.path.join(cache_dir, ticker)
-    api_path_dir = os.path.join(ticker_dir, api_path)
-    os.makedirs(api_path_dir, exist_ok=True)
+        return None
+
+    # Subfolder for the ticker first, then the api_path (e.g., eod, calendar_earnings)
+    api_path_dir = os.path.join(cache_dir, ticker, api_path)
     
     # Create a descriptive filename using the cleaned query parameters, excluding the api_token and api_path
     filename_parts = url.split('?')[1].replace('&', '_').replace('=', '_').replace('.', '_')  # Clean the query parameters
@@ -53,16 +165,41 @@ def download_and_cache_json(url, cache_dir=CACHE_DIR):
     filename = f"{filename_parts}.json".strip('_')  # Ensure the filename doesn't start or end with underscores
     
     # Define the full cache file path
-    cache_file = os.path.join(api_path_dir, filename)
+    return os.path.join(api_path_dir, filename)
+
+# Helper function to download data and cache it
+def download_and_cache_json(url, cache_dir=CACHE_DIR, force_refresh=False, count_access=True):
+    # force_refresh: download even if the response is cached (e.g. to refresh recent data)
+    # count_access: count the request in the access stats (off for prefetching)
+    cache_file = cache_file_for_url(url, cache_dir)
+    
+    # Ensure that the ticker is properly identified, otherwise skip caching
+    if cache_file is None:
+        print(f"Warning: Ticker not found in URL {url}. Skipping cache.")
+        return None, 404  # Return None and a status code indicating "Not Found"
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
 
     # Check if the file exists in the cache
-    if os.path.exists(cache_file):
-        print(f"Loading from cache: {cache_file}")
-        with open(cache_file, 'r') as f:
-            data = json.load(f)
+    seen = _modified_time(cache_file)
+    data = None if force_refresh else read_cache(cache_file)
+    if count_access:
+        record_access(extract_info_from_url(url)[1], data is not None)
+    if data is not None:
         return data, 200  # Return cached data with a 200 status code
 
-    # If not in cache, download the data
+    # Only one caller (thread or process) downloads a given file at a time; the others
+    # wait for the lock and then read what it cached, unless the download failed
+    with file_lock(f"{cache_file}.lock", f"Waiting for download in progress: {url}"):
+        if not force_refresh or _modified_time(cache_file) != seen:
+            data = read_cache(cache_file)
+            if data is not None:
+                return data, 200
+        return download_json(url, cache_file)
+
+# Helper function to download a URL and cache the JSON response
+def download_json(url, cache_file):
+    # requests is only imported when something is downloaded
+    import requests
     print(f"Downloading from URL: {url}")
     response = requests.get(url)
     
@@ -75,16 +212,33 @@ def download_and_cache_json(url, cache_dir=CACHE_DIR):
             return None, response.status_code  # Return None if JSON parsing fails
 
         # Save the response JSON to cache
-        with open(cache_file, 'w') as f:
-            json.dump(data, f)
+        write_cache(cache_file, data)
         return data, response.status_code
     else:
         return None, response.status_code
 
 
+# Datasets download_data fetches for each ticker
+DATASETS = ['prices', 'earnings', 'dividends', 'market_cap']
+
+# Helper function to build the API URL of one dataset for one ticker
+def dataset_url(dataset, ticker, start_date, end_date, api_key):
+    if dataset == 'prices':
+        return f"{API_BASE_URL}/eod/{ticker}?from={start_date}&to={end_date}&api_token={api_key}&fmt=json"
+    if dataset == 'earnings':
+        return f"{API_BASE_URL}/calendar/earnings?api_token={api_key}&from={start_date}&to={end_date}&symbols={ticker}&fmt=json"
+    if dataset == 'dividends':
+        return f"{API_BASE_URL}/div/{ticker}?from={start_date}&to={end_date}&api_token={api_key}&fmt=json"
+    if dataset == 'market_cap':
+        ticker_to_request = ticker
+        if ticker_to_request == 'NESN.SW':
+            ticker_to_request = 'NSRGY.US'
+        return f"{API_BASE_URL}/historical-market-cap/{ticker_to_request}?from={start_date}&to={end_date}&api_token={api_key}&fmt=json"
+    raise ValueError(f"Unknown dataset '{dataset}', expected one of {DATASETS}")
+
 # Helper function to download price data from the API with caching
 def fetch_price_data(ticker, start_date, end_date, api_key):
-    url = f"https://eodhd.com/api/eod/{ticker}?from={start_date}&to={end_date}&api_token={api_key}&fmt=json"
+    url = dataset_url('prices', ticker, start_date, end_date, api_key)
     data, status_code = download_and_cache_json(url)
     
     if status_code == 200 and data:
@@ -99,7 +253,7 @@ def fetch_price_data(ticker, start_date, end_date, api_key):
     
 # Helper function to download earnings data from the API with caching
 def fetch_earnings_data(ticker, start_date, end_date, api_key):
-    url = f"https://eodhd.com/api/calendar/earnings?api_token={api_key}&from={start_date}&to={end_date}&symbols={ticker}&fmt=json"
+    url = dataset_url('earnings', ticker, start_date, end_date, api_key)
     data, status_code = download_and_cache_json(url)
     
     if status_code == 200 and data:
@@ -119,7 +273,7 @@ def fetch_earnings_data(ticker, start_date, end_date, api_key):
 
 # Helper function to download dividend data from the API with caching
 def fetch_dividend_data(ticker, start_date, end_date, api_key):
-    url = f"https://eodhd.com/api/div/{ticker}?from={start_date}&to={end_date}&api_token={api_key}&fmt=json"
+    url = dataset_url('dividends', ticker, start_date, end_date, api_key)
     data, status_code = download_and_cache_json(url)
     
     if status_code == 200 and data:
@@ -131,11 +285,7 @@ def fetch_dividend_data(ticker, start_date, end_date, api_key):
 
 # Fetch market cap data and return with status code
 def fetch_market_cap_data(ticker, start_date, end_date, api_key):
-    ticker_to_request = ticker
-    if ticker_to_request == 'NESN.SW':
-        ticker_to_request = 'NSRGY.US'
-
-    url = f"https://eodhd.com/api/historical-market-cap/{ticker_to_request}?from={start_date}&to={end_date}&api_token={api_key}&fmt=json"
+    url = dataset_url('market_cap', ticker, start_date, end_date, api_key)
     data, status_code = download_and_cache_json(url)
     
     if status_code == 200 and data:
@@ -174,6 +324,7 @@ def download_data(api_key, tickers, start_date, end_date):
             'market_cap_status': market_cap_status
         }
 
+    save_access_stats()
     print("\nData retrieval completed!")
 
     return downloaded_data
\ No newline at end of file
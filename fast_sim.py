@@ -0,0 +1,293 @@
+import heapq
+import numpy as np
+import pandas as pd
+
+import breakout_conditions as bc
+import calendar_rules as cr
+import top_stocks as ts
+
+# Array-based version of process.process for runs that need many simulations
+# (Monte Carlo, walk-forward, parameter sweeps).
+#
+# Everything that does not depend on the strategy parameters (aligned prices,
+# top-N membership, trading calendars, event dates) is built once into a "model"
+# of NumPy arrays indexed by day number (0 = first day of top_stocks_by_date).
+# A simulation is then a walk over the trades in buy-date order, with a heap of
+# pending sales, so its cost is proportional to the number of trades rather than
+# the number of days. Results match process.process (sales before buys on the
+# same day, first free pool gets the trade, values recorded at the start of each day).
+#
+# Not every process.process option is supported: breakout exit masks (forced exits),
+# allocation policies other than 'first_free' and trading-day rule offsets raise a
+# ValueError (see check_supported) rather than silently giving different results.
+
+UNSUPPORTED = "fast_sim does not support {}; use process.process instead"
+DAY_KEY_SCALE = 2 ** 32  # Spacing of the tickers in the (ticker, day number) keys
+
+
+def check_supported(entry_rule=None, exit_rule=None, exit_mask=None, allocation='first_free'):
+    # Raises for the process.process options that the array simulation does not implement
+    for rule in (entry_rule, exit_rule):
+        if rule is not None and rule['unit'] != 'calendar':
+            raise ValueError(UNSUPPORTED.format("trading-day rule offsets"))
+    if exit_mask is not None:
+        raise ValueError(UNSUPPORTED.format("breakout exit masks (forced exits)"))
+    if allocation != 'first_free':
+        raise ValueError(UNSUPPORTED.format(f"the '{allocation}' allocation policy"))
+
+
+def build_model(downloaded_data, top_stocks_by_date, block_mask=None):
+    """
+    Precomputes the arrays shared by every simulation over the same data.
+
+    Args:
+        downloaded_data (dict): Dictionary containing the stock data.
+        top_stocks_by_date: Top stocks by date (a top_stocks.TopStocksMembership or
+            a create_top_stocks_by_date frame).
+        block_mask (pd.DataFrame): Optional breakout block mask (see breakout_conditions),
+            or its breakout_conditions.mask_to_lookup lookup.
+
+    Returns:
+        dict: The model arrays.
+    """
+    top_membership = ts.as_membership(top_stocks_by_date)
+    full_date_range = pd.date_range(start=top_membership.first_date, end=top_membership.last_date, freq='D')
+    tickers = list(downloaded_data.keys())
+    ticker_index = {ticker: j for j, ticker in enumerate(tickers)}
+    num_days = len(full_date_range)
+
+    # Forward-filled prices over every calendar day, as process.process uses them
+    prices = np.full((num_days, len(tickers)), np.nan)
+    for j, ticker in enumerate(tickers):
+        ticker_prices = downloaded_data[ticker]['prices']
+        if not ticker_prices.empty:
+            prices[:, j] = ticker_prices['adjusted_close'].reindex(full_date_range).ffill().to_numpy()
+
+    # Top-N membership per day, filled one membership interval at a time
+    membership = np.zeros((num_days, len(tickers)), dtype=bool)
+    first_value = full_date_range[0].value
+    day_length = pd.Timedelta(days=1).value
+    for ticker, (starts, ends) in top_membership.intervals.items():
+        if ticker in ticker_index:
+            for start, end in zip(starts, ends):
+                first_row = max((start - first_value) // day_length, 0)
+                end_row = min((end - first_value) // day_length, num_days)
+                membership[first_row:end_row, ticker_index[ticker]] = True
+    block_mask = bc.as_mask(block_mask)
+    if block_mask is not None:
+        blocked = block_mask.reindex(index=full_date_range, columns=tickers, fill_value=False).to_numpy(dtype=bool)
+        membership &= ~blocked
+
+    # Every ticker's full trading calendar (including days outside the range, as
+    # calendar_rules.compile_trade_schedule rolls on it) as one sorted array of
+    # ticker * DAY_KEY_SCALE + day number, so dates roll with a single searchsorted
+    start = np.datetime64(full_date_range[0], 'ns')
+    trading_keys = [j * DAY_KEY_SCALE + (cr.trading_days_for(downloaded_data[ticker]) - start) // np.timedelta64(1, 'D')
+                    for j, ticker in enumerate(tickers)]
+    trading_keys = np.concatenate(trading_keys).astype(np.int64) if trading_keys else np.empty(0, dtype=np.int64)
+
+    return {
+        'dates': full_date_range,
+        'tickers': tickers,
+        'prices': prices,
+        'membership': membership,
+        'trading_keys': trading_keys,
+        'downloaded_data': downloaded_data
+    }
+
+
+def anchor_events(model, anchor):
+    """
+    Flattens one anchor type over all tickers into (day numbers, ticker indices),
+    sorted by ticker and then day. Day numbers are relative to the model's first
+    date and may fall outside the simulated range.
+    """
+    start = model['dates'][0]
+    days = []
+    ticker_indices = []
+    for j, ticker in enumerate(model['tickers']):
+        dates = cr.anchor_dates(model['downloaded_data'][ticker], anchor, model['dates'][0], model['dates'][-1])
+        ticker_days = ((dates - np.datetime64(start, 'ns')) // np.timedelta64(1, 'D')).astype(np.int64)
+        days.append(ticker_days)
+        ticker_indices.append(np.full(len(ticker_days), j, dtype=np.int64))
+    if not days:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(days), np.concatenate(ticker_indices)
+
+
+def roll_days(model, ticker_idx, target_days, roll):
+    # Vectorised version of calendar_rules.apply_rule for calendar-day offsets. Rolled
+    # days may fall outside the model range; build_trades drops those trades afterwards
+    trading_keys = model['trading_keys']
+    target_keys = ticker_idx * DAY_KEY_SCALE + target_days
+    if roll == 'preceding':
+        positions = np.searchsorted(trading_keys, target_keys, side='right') - 1
+    else:
+        positions = np.searchsorted(trading_keys, target_keys, side='left')
+    valid = (positions >= 0) & (positions < len(trading_keys))
+    rolled_keys = trading_keys[np.clip(positions, 0, max(len(trading_keys) - 1, 0))] if len(trading_keys) else target_keys
+    rolled = rolled_keys - ticker_idx * DAY_KEY_SCALE
+    valid &= np.abs(rolled) < DAY_KEY_SCALE // 2  # Not a day of the next/previous ticker
+    if roll == 'none':
+        valid &= rolled == target_days
+    return rolled, valid
+
+
+def build_trades(model, entry_rule, exit_rule, entry_jitter=None, exit_jitter=None, entry_events=None, exit_events=None):
+    """
+    Compiles entry/exit rules into trade arrays on the model's day numbers.
+
+    Only calendar-day offsets are supported here. entry_jitter/exit_jitter are optional
+    integer arrays (one per entry event) added to the rule offsets, which is how the
+    Monte Carlo runs perturb event dates. entry_events/exit_events can be passed in
+    (from anchor_events) to avoid rebuilding them for every call.
+
+    Returns:
+        tuple: (buy days, sell days, ticker indices), sorted by buy day then ticker.
+    """
+    check_supported(entry_rule, exit_rule)
+
+    entry_days, entry_tickers = entry_events if entry_events is not None else anchor_events(model, entry_rule['anchor'])
+    exit_days, exit_tickers = exit_events if exit_events is not None else anchor_events(model, exit_rule['anchor'])
+
+    entry_offsets = entry_rule['offset'] + (0 if entry_jitter is None else entry_jitter)
+    buy_days, valid = roll_days(model, entry_tickers, entry_days + entry_offsets, entry_rule['roll'])
+
+    # First exit anchor strictly after the buy day, for the same ticker
+    exit_keys = exit_tickers * DAY_KEY_SCALE + exit_days
+    buy_keys = entry_tickers * DAY_KEY_SCALE + buy_days
+    next_exit = np.searchsorted(exit_keys, buy_keys, side='right')
+    has_exit = next_exit < len(exit_keys)
+    next_exit = np.clip(next_exit, 0, max(len(exit_keys) - 1, 0))
+    if len(exit_keys):
+        has_exit &= exit_tickers[next_exit] == entry_tickers
+        exit_offsets = exit_rule['offset'] + (0 if exit_jitter is None else exit_jitter)
+        sell_days, sell_valid = roll_days(model, entry_tickers, exit_days[next_exit] + exit_offsets, exit_rule['roll'])
+    else:
+        sell_days, sell_valid = buy_days, np.zeros(len(buy_days), dtype=bool)
+
+    # Like compile_trade_schedule, trades are only dropped for the range after rolling
+    valid &= has_exit & sell_valid & (sell_days > buy_days) & (buy_days >= 0) & (sell_days < len(model['dates']))
+    buy_days, sell_days, ticker_idx = buy_days[valid], sell_days[valid], entry_tickers[valid]
+
+    # One trade per ticker per buy day, in buy day then ticker order
+    _, unique_positions = np.unique(ticker_idx * DAY_KEY_SCALE + buy_days, return_index=True)
+    buy_days, sell_days, ticker_idx = buy_days[unique_positions], sell_days[unique_positions], ticker_idx[unique_positions]
+    order = np.lexsort((ticker_idx, buy_days))
+    return buy_days[order], sell_days[order], ticker_idx[order]
+
+
+def simulate(model, buy_days, sell_days, ticker_idx, initial_investment, num_pools, pool_order=None, record_trades=False, start_day=0, end_day=None):
+    """
+    Runs one simulation over precompiled trades.
+
+    Args:
+        model (dict): From build_model.
+        buy_days, sell_days, ticker_idx (np.ndarray): Trades sorted by buy day (from build_trades).
+        initial_investment (float): Capital split equally across pools.
+        num_pools (int): Number of pools.
+        pool_order (list): Order in which pools are offered a trade (default 0..num_pools-1).
+        record_trades (bool): Also return the executed trades (for equity_curve).
+        start_day, end_day (int): Optional sub-range of days to simulate (end_day inclusive).
+            Only trades bought and sold inside the range are taken, as if process.process
+            had been run on that range alone.
+
+    Returns:
+        dict: final_value (at the start of the last day, as recorded by process.process),
+            num_trades (trades bought inside the range), free_capital_errors and, if
+            requested, trades.
+    """
+    prices = model['prices']
+    membership = model['membership']
+    last_day = len(model['dates']) - 1 if end_day is None else end_day
+    pool_order = range(num_pools) if pool_order is None else pool_order
+
+    free_capital_pools = [initial_investment / num_pools] * num_pools
+    pool_availability = [True] * num_pools
+    holdings = {}  # pool -> (ticker index, amount invested, buy day, sell day)
+    sales = []  # heap of (sell day, pool)
+    free_capital_errors = 0
+    num_trades = 0
+    trades = []
+
+    def settle(before_day):
+        # Sell every position due on or before before_day
+        while sales and sales[0][0] <= before_day:
+            sell_day, i = heapq.heappop(sales)
+            ticker, amount, buy_day, _ = holdings.pop(i)
+            free_capital_pools[i] += amount * prices[sell_day, ticker] / prices[buy_day, ticker]
+            pool_availability[i] = True
+
+    # Events on the last day happen after its values are recorded, so they do not count
+    for buy_day, sell_day, ticker in zip(buy_days.tolist(), sell_days.tolist(), ticker_idx.tolist()):
+        if buy_day < start_day:
+            continue
+        if buy_day >= last_day:
+            break
+        if sell_day > last_day:
+            continue
+        settle(buy_day)
+        if not membership[buy_day, ticker]:
+            continue
+
+        for i in pool_order:
+            if free_capital_pools[i] > 0 and pool_availability[i]:
+                amount = free_capital_pools[i]
+                holdings[i] = (ticker, amount, buy_day, sell_day)
+                free_capital_pools[i] = 0
+                pool_availability[i] = False
+                heapq.heappush(sales, (sell_day, i))
+                num_trades += 1
+                if record_trades:
+                    trades.append((i, ticker, buy_day, sell_day, amount))
+                break
+        else:
+            free_capital_errors += 1
+    settle(last_day - 1)
+
+    final_value = sum(free_capital_pools)
+    for ticker, amount, buy_day, _ in holdings.values():
+        final_value += amount * prices[last_day, ticker] / prices[buy_day, ticker]
+
+    result = {'final_value': final_value, 'num_trades': num_trades, 'free_capital_errors': free_capital_errors}
+    if record_trades:
+        result['trades'] = trades
+    return result
+
+
+def equity_curve(model, trades, initial_investment, num_pools, start_day=0, end_day=None):
+    """
+    Rebuilds the daily start-of-day values from the trades returned by simulate.
+
+    Returns:
+        pd.DataFrame: 'Free Capital', 'Invested' and 'Total' per date from start_day to end_day.
+    """
+    prices = model['prices']
+    num_days = len(model['dates']) if end_day is None else end_day + 1
+    free_changes = np.zeros(num_days + 1)
+    free_changes[start_day] = initial_investment
+    invested = np.zeros(num_days)
+
+    for _, ticker, buy_day, sell_day, amount in trades:
+        # Held from the day after the buy up to and including the sell day
+        last_held = min(sell_day, num_days - 1)
+        invested[buy_day + 1:last_held + 1] += amount * prices[buy_day + 1:last_held + 1, ticker] / prices[buy_day, ticker]
+        free_changes[buy_day + 1] -= amount
+        if sell_day + 1 <= num_days - 1:
+            free_changes[sell_day + 1] += amount * prices[sell_day, ticker] / prices[buy_day, ticker]
+
+    free_capital = np.cumsum(free_changes)[start_day:num_days]
+    invested = invested[start_day:num_days]
+    return pd.DataFrame({'Free Capital': free_capital, 'Invested': invested, 'Total': free_capital + invested}, index=model['dates'][start_day:num_days])
+
+
+def strategy_metrics(final_value, start_date, end_date, total_investment, equity=None):
+    # Same formulas as process.calculate_strategy_metrics, from a final value (and optional equity curve)
+    total_days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days
+    metrics = {}
+    if equity is not None:
+        metrics['total_capital_tracked'] = equity['Total'].sum()
+        metrics['percent_time_in_market'] = (equity['Invested'].sum() / metrics['total_capital_tracked']) * 100 if metrics['total_capital_tracked'] > 0 else 0
+    metrics['overall_return'] = ((final_value - total_investment) / total_investment) * 100 if total_investment > 0 else 0
+    metrics['annualized_return'] = ((final_value / total_investment) ** (365 / total_days) - 1) * 100 if total_days > 0 else 0
+    return metrics
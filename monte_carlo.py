@@ -0,0 +1,162 @@
+import os
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+import calendar_rules as cr
+import fast_sim as fs
+
+# Monte Carlo robustness runs.
+#
+# Each path re-runs the strategy with:
+#   - the entry and exit offsets jittered by up to +/- jitter_days per trade
+#     (a day's slip in the ex-dividend or earnings date),
+#   - the pools offered each trade in a random order, and trades on the same day
+#     considered in a random order,
+#   - optionally a bootstrapped (resampled with replacement) subset of the trades.
+#
+# The data-dependent arrays are built once (fast_sim.build_model) and shared by all
+# paths. Paths are split into batches that run in parallel worker processes.
+
+_worker_state = {}
+
+
+def _init_worker(model, entry_rule, exit_rule, entry_events, exit_events, settings):
+    # Runs once per worker process, so the model is not sent again with every batch
+    _worker_state.update({
+        'model': model,
+        'entry_rule': entry_rule,
+        'exit_rule': exit_rule,
+        'entry_events': entry_events,
+        'exit_events': exit_events,
+        'settings': settings
+    })
+
+
+def _run_batch(batch):
+    seed, num_paths = batch
+    return simulate_paths(_worker_state['model'], _worker_state['entry_rule'], _worker_state['exit_rule'],
+                          _worker_state['entry_events'], _worker_state['exit_events'], _worker_state['settings'],
+                          np.random.default_rng(seed), num_paths)
+
+
+def simulate_paths(model, entry_rule, exit_rule, entry_events, exit_events, settings, rng, num_paths):
+    """
+    Runs num_paths perturbed simulations.
+
+    Returns:
+        list: One (final_value, num_trades, free_capital_errors) tuple per path.
+    """
+    jitter_days = settings['jitter_days']
+    num_pools = settings['num_pools']
+    num_events = len(entry_events[0])
+    results = []
+
+    for _ in range(num_paths):
+        entry_jitter = rng.integers(-jitter_days, jitter_days + 1, size=num_events) if jitter_days else None
+        exit_jitter = rng.integers(-jitter_days, jitter_days + 1, size=num_events) if jitter_days else None
+        buy_days, sell_days, ticker_idx = fs.build_trades(model, entry_rule, exit_rule, entry_jitter, exit_jitter, entry_events, exit_events)
+
+        if settings['bootstrap'] and len(buy_days):
+            # Resample the trades with replacement, keeping them in buy-date order
+            picks = np.sort(rng.integers(0, len(buy_days), size=len(buy_days)))
+            buy_days, sell_days, ticker_idx = buy_days[picks], sell_days[picks], ticker_idx[picks]
+
+        pool_order = None
+        if settings['shuffle']:
+            pool_order = rng.permutation(num_pools).tolist()
+            # Random order among the trades of the same day
+            order = np.lexsort((rng.random(len(buy_days)), buy_days))
+            buy_days, sell_days, ticker_idx = buy_days[order], sell_days[order], ticker_idx[order]
+
+        result = fs.simulate(model, buy_days, sell_days, ticker_idx, settings['initial_investment'], num_pools, pool_order)
+        results.append((result['final_value'], result['num_trades'], result['free_capital_errors']))
+
+    return results
+
+
+def run_monte_carlo(downloaded_data, top_stocks_by_date, days_after_dividend, days_before_earnings, initial_investment, num_pools,
+                    start_date, end_date, num_paths=10000, jitter_days=1, shuffle=True, bootstrap=True,
+                    entry_rule=None, exit_rule=None, block_mask=None, exit_mask=None, allocation='first_free',
+                    seed=0, num_workers=None, batch_size=500):
+    """
+    Runs Monte Carlo robustness simulations of the strategy.
+
+    Args:
+        downloaded_data (dict): Dictionary containing the stock data.
+        top_stocks_by_date: Top stocks by date (TopStocksMembership or frame, see top_stocks).
+        days_after_dividend, days_before_earnings (int): Strategy parameters, as for process.process.
+        initial_investment (float): Capital split equally across pools.
+        num_pools (int): Number of pools.
+        start_date, end_date (str): Period used for the annualised return.
+        num_paths (int): Number of simulations.
+        jitter_days (int): Maximum slip, in days, applied to each entry and exit date.
+        shuffle (bool): Randomise pool assignment and same-day trade order.
+        bootstrap (bool): Resample the trades with replacement on each path.
+        entry_rule, exit_rule (dict): Optional calendar_rules rules (calendar-day offsets only).
+        block_mask (pd.DataFrame): Optional breakout block mask.
+        exit_mask, allocation: As for process.process; only None and 'first_free' are
+            supported (anything else raises a ValueError, see fast_sim.check_supported).
+        seed (int): Seed for reproducible runs.
+        num_workers (int): Worker processes (default: number of CPUs).
+        batch_size (int): Paths per batch sent to a worker.
+
+    Returns:
+        tuple: (paths DataFrame with one row per path, summary dict)
+    """
+    default_entry_rule, default_exit_rule = cr.default_rules(days_after_dividend, days_before_earnings)
+    entry_rule = entry_rule or default_entry_rule
+    exit_rule = exit_rule or default_exit_rule
+    fs.check_supported(entry_rule, exit_rule, exit_mask, allocation)
+
+    model = fs.build_model(downloaded_data, top_stocks_by_date, block_mask)
+    entry_events = fs.anchor_events(model, entry_rule['anchor'])
+    exit_events = fs.anchor_events(model, exit_rule['anchor'])
+    settings = {'jitter_days': int(jitter_days), 'num_pools': num_pools, 'initial_investment': initial_investment,
+                'shuffle': shuffle, 'bootstrap': bootstrap}
+
+    # Unperturbed run, for reference
+    buy_days, sell_days, ticker_idx = fs.build_trades(model, entry_rule, exit_rule, entry_events=entry_events, exit_events=exit_events)
+    base = fs.simulate(model, buy_days, sell_days, ticker_idx, initial_investment, num_pools)
+    base_metrics = fs.strategy_metrics(base['final_value'], start_date, end_date, initial_investment)
+
+    # Independent random streams per batch, so results do not depend on the number of workers
+    batch_sizes = [min(batch_size, num_paths - start) for start in range(0, num_paths, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    batches = list(zip(seeds, batch_sizes))
+
+    num_workers = num_workers or os.cpu_count() or 1
+    num_workers = min(num_workers, len(batches))
+    print(f"Running {num_paths} Monte Carlo paths in {len(batches)} batches on {num_workers} worker(s)...")
+
+    if num_workers <= 1:
+        batch_results = [simulate_paths(model, entry_rule, exit_rule, entry_events, exit_events, settings, np.random.default_rng(s), n)
+                         for s, n in batches]
+    else:
+        # Workers only need the arrays, not the original DataFrames
+        worker_model = {key: value for key, value in model.items() if key != 'downloaded_data'}
+        with multiprocessing.Pool(num_workers, initializer=_init_worker,
+                                  initargs=(worker_model, entry_rule, exit_rule, entry_events, exit_events, settings)) as pool:
+            batch_results = pool.map(_run_batch, batches)
+
+    rows = [row for batch in batch_results for row in batch]
+    paths = pd.DataFrame(rows, columns=['final_value', 'num_trades', 'free_capital_errors'])
+    metrics = [fs.strategy_metrics(value, start_date, end_date, initial_investment) for value in paths['final_value']]
+    paths['overall_return'] = [m['overall_return'] for m in metrics]
+    paths['annualized_return'] = [m['annualized_return'] for m in metrics]
+
+    summary = {'num_paths': len(paths), 'base': base_metrics}
+    for column in ['overall_return', 'annualized_return']:
+        values = paths[column].to_numpy()
+        summary[column] = {
+            'mean': float(np.mean(values)),
+            'std': float(np.std(values)),
+            'median': float(np.median(values)),
+            'ci_95': (float(np.percentile(values, 2.5)), float(np.percentile(values, 97.5))),
+            'ci_90': (float(np.percentile(values, 5)), float(np.percentile(values, 95))),
+            'prob_loss': float(np.mean(values < 0))
+        }
+        print(f"{column}: base {base_metrics[column]:.2f}%, mean {summary[column]['mean']:.2f}%, "
+              f"95% CI [{summary[column]['ci_95'][0]:.2f}%, {summary[column]['ci_95'][1]:.2f}%]")
+
+    return paths, summary
@@ -0,0 +1,319 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# On-disk columnar store for whole-exchange universes.
+#
+# Layout of a store directory:
+#   meta.json                  tickers, number of dates and field names
+#   dates.bin                  int64 days since epoch, one per row (trading days, sorted)
+#   <field>.bin                float64 matrix (dates x tickers), row-major, NaN = no data
+#   <event>_dates.bin          int64 days since epoch, grouped by ticker and sorted
+#   <event>_offsets.bin        int64 offsets into <event>_dates.bin (len(tickers) + 1)
+#
+# Rows are stored date by date, so appending a new trading day is a plain append
+# to the end of every field file. Everything is opened with np.memmap, so opening
+# is near-instant and only the pages of the slices actually touched are read.
+
+META_FILE = 'meta.json'
+PANEL_FIELDS = ['adjusted_close', 'market_cap']
+EVENT_FIELDS = ['dividends', 'earnings_dates']
+
+
+def _to_days(dates):
+    # Convert anything date-like to int64 days since epoch
+    return np.asarray(pd.to_datetime(pd.Index(dates)).values.astype('datetime64[D]').astype(np.int64))
+
+
+def _write_meta(store_dir, meta):
+    # Write to a temporary file first, so readers never see a half-written meta.json
+    tmp_file = os.path.join(store_dir, META_FILE + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_file, os.path.join(store_dir, META_FILE))
+
+
+def _read_meta(store_dir):
+    with open(os.path.join(store_dir, META_FILE), 'r') as f:
+        return json.load(f)
+
+
+def _open_array(path, dtype, shape):
+    # np.memmap refuses zero-sized files, so return an empty array instead
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+def _write_events(store_dir, name, events_by_ticker, tickers):
+    # Store events in CSR form: one flat array of dates plus per-ticker offsets
+    offsets = [0]
+    chunks = []
+    for ticker in tickers:
+        days = np.unique(_to_days(events_by_ticker.get(ticker, []))) if len(events_by_ticker.get(ticker, [])) else np.empty(0, dtype=np.int64)
+        chunks.append(days)
+        offsets.append(offsets[-1] + len(days))
+
+    flat = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+    flat.astype(np.int64).tofile(os.path.join(store_dir, f"{name}_dates.bin"))
+    np.asarray(offsets, dtype=np.int64).tofile(os.path.join(store_dir, f"{name}_offsets.bin"))
+
+
+def build_panel_store(downloaded_data, store_dir):
+    """
+    Builds a panel store from the dictionary returned by download_info.download_data.
+
+    Args:
+        downloaded_data (dict): Per-ticker prices, market caps, dividends and earnings.
+        store_dir (str): Directory to write the store to (created if needed).
+
+    Returns:
+        PanelStore: The newly written store, opened read-only.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    tickers = list(downloaded_data.keys())
+
+    # The row index is the union of all price and market cap dates
+    all_days = set()
+    for data in downloaded_data.values():
+        for frame in (data.get('prices'), data.get('market_cap')):
+            if frame is not None and not frame.empty:
+                all_days.update(_to_days(frame.index).tolist())
+    days = np.array(sorted(all_days), dtype=np.int64)
+    days.tofile(os.path.join(store_dir, 'dates.bin'))
+
+    # Fill each field matrix column by column
+    columns = {'adjusted_close': ('prices', 'adjusted_close'), 'market_cap': ('market_cap', 'value')}
+    for field, (key, column) in columns.items():
+        matrix = np.full((len(days), len(tickers)), np.nan, dtype=np.float64)
+        for j, ticker in enumerate(tickers):
+            frame = downloaded_data[ticker].get(key)
+            if frame is None or frame.empty:
+                continue
+            rows = np.searchsorted(days, _to_days(frame.index))
+            matrix[rows, j] = frame[column].to_numpy(dtype=np.float64)
+        matrix.tofile(os.path.join(store_dir, f"{field}.bin"))
+
+    _write_events(store_dir, 'dividends', {t: d.get('dividends', []) for t, d in downloaded_data.items()}, tickers)
+    _write_events(store_dir, 'earnings_dates', {t: d.get('earnings_dates', []) for t, d in downloaded_data.items()}, tickers)
+
+    _write_meta(store_dir, {'tickers': tickers, 'num_dates': len(days), 'fields': PANEL_FIELDS, 'events': EVENT_FIELDS})
+    return PanelStore(store_dir)
+
+
+def append_trading_days(store_dir, dates, field_values):
+    """
+    Appends new trading days to an existing store.
+
+    Args:
+        store_dir (str): Directory of the store.
+        dates (list-like): New trading dates, all later than the last stored date.
+        field_values (dict): Field name -> array of shape (len(dates), len(tickers)).
+            Missing fields are written as NaN.
+
+    Returns:
+        int: The number of rows appended.
+    """
+    meta = _read_meta(store_dir)
+    num_tickers = len(meta['tickers'])
+    new_days = _to_days(dates)
+    if len(new_days) == 0:
+        return 0
+
+    existing_days = _open_array(os.path.join(store_dir, 'dates.bin'), np.int64, (meta['num_dates'],))
+    if len(existing_days) and new_days[0] <= existing_days[-1]:
+        raise ValueError(f"Appended dates must be after {np.datetime64(int(existing_days[-1]), 'D')}")
+    if np.any(np.diff(new_days) <= 0):
+        raise ValueError("Appended dates must be strictly increasing")
+
+    all_values = {}
+    for field in meta['fields']:
+        values = field_values.get(field)
+        if values is None:
+            values = np.full((len(new_days), num_tickers), np.nan)
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (len(new_days), num_tickers):
+            raise ValueError(f"{field} has shape {values.shape}, expected {(len(new_days), num_tickers)}")
+        all_values[field] = values
+
+    # Append the data first and update the row count last, so readers opening the
+    # store in between still see a consistent (older) shape. An append that was
+    # interrupted before meta.json was updated leaves extra rows at the end of some
+    # files, so every file is cut back to the committed row count before appending.
+    for field, values in all_values.items():
+        with open(os.path.join(store_dir, f"{field}.bin"), 'r+b') as f:
+            f.truncate(meta['num_dates'] * num_tickers * 8)
+            f.seek(0, os.SEEK_END)
+            values.tofile(f)
+    with open(os.path.join(store_dir, 'dates.bin'), 'r+b') as f:
+        f.truncate(meta['num_dates'] * 8)
+        f.seek(0, os.SEEK_END)
+        new_days.astype(np.int64).tofile(f)
+
+    meta['num_dates'] += len(new_days)
+    _write_meta(store_dir, meta)
+    return len(new_days)
+
+
+def update_columns(store_dir, field, values_by_ticker):
+    """
+    Overwrites whole columns of one field in place, e.g. a ticker's adjusted closes
+    when a split or dividend re-bases its history.
+
+    Args:
+        store_dir (str): Directory of the store.
+        field (str): Field name.
+        values_by_ticker (dict): Ticker -> array with one value per stored date.
+    """
+    meta = _read_meta(store_dir)
+    ticker_index = {ticker: j for j, ticker in enumerate(meta['tickers'])}
+    shape = (meta['num_dates'], len(meta['tickers']))
+    if not values_by_ticker or 0 in shape:
+        return
+    matrix = np.memmap(os.path.join(store_dir, f"{field}.bin"), dtype=np.float64, mode='r+', shape=shape)
+    for ticker, values in values_by_ticker.items():
+        matrix[:, ticker_index[ticker]] = np.asarray(values, dtype=np.float64)
+    matrix.flush()
+    del matrix
+
+
+def append_events(store_dir, name, new_events_by_ticker):
+    """
+    Merges new event dates (e.g. dividends) into the store. Event tables are small,
+    so they are rewritten rather than appended in place.
+    """
+    store = PanelStore(store_dir)
+    merged = {}
+    for ticker in store.tickers:
+        existing = store.events(name, ticker)
+        extra = _to_days(new_events_by_ticker.get(ticker, [])) if len(new_events_by_ticker.get(ticker, [])) else np.empty(0, dtype=np.int64)
+        merged[ticker] = np.concatenate([existing.astype(np.int64), extra]).astype('datetime64[D]')
+    del store
+    _write_events(store_dir, name, merged, _read_meta(store_dir)['tickers'])
+
+
+class PanelStore:
+    """
+    Read-only, memory-mapped view over a panel store directory.
+
+    All field accessors return NumPy views into the mapped files, so memory use is
+    proportional to the slice that is actually read.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        meta = _read_meta(store_dir)
+        self.tickers = meta['tickers']
+        self.fields = meta['fields']
+        self.ticker_index = {ticker: j for j, ticker in enumerate(self.tickers)}
+        num_dates = meta['num_dates']
+
+        self.days = _open_array(os.path.join(store_dir, 'dates.bin'), np.int64, (num_dates,))
+        self._fields = {
+            field: _open_array(os.path.join(store_dir, f"{field}.bin"), np.float64, (num_dates, len(self.tickers)))
+            for field in self.fields
+        }
+        self._events = {}
+        for name in meta['events']:
+            offsets = _open_array(os.path.join(store_dir, f"{name}_offsets.bin"), np.int64, (len(self.tickers) + 1,))
+            num_events = int(offsets[-1]) if len(offsets) else 0
+            self._events[name] = (_open_array(os.path.join(store_dir, f"{name}_dates.bin"), np.int64, (num_events,)), offsets)
+
+    @property
+    def dates(self):
+        # DatetimeIndex of all stored trading days
+        return pd.DatetimeIndex(self.days.astype('datetime64[D]').astype('datetime64[ns]'))
+
+    def row_range(self, start_date=None, end_date=None):
+        # Row bounds [i0, i1) covering start_date..end_date inclusive
+        i0 = 0 if start_date is None else int(np.searchsorted(self.days, _to_days([start_date])[0], side='left'))
+        i1 = len(self.days) if end_date is None else int(np.searchsorted(self.days, _to_days([end_date])[0], side='right'))
+        return i0, i1
+
+    def field(self, name, start_date=None, end_date=None):
+        # Zero-copy (dates x tickers) view of one field for the requested date range
+        i0, i1 = self.row_range(start_date, end_date)
+        return self._fields[name][i0:i1]
+
+    def column(self, name, ticker, start_date=None, end_date=None):
+        # Zero-copy (strided) view of one ticker's values for the requested date range
+        return self.field(name, start_date, end_date)[:, self.ticker_index[ticker]]
+
+    def events(self, name, ticker):
+        # Zero-copy view of one ticker's event dates as datetime64[D]
+        flat, offsets = self._events[name]
+        j = self.ticker_index[ticker]
+        return flat[offsets[j]:offsets[j + 1]].view('datetime64[D]')
+
+    def last_valid_before(self, name, row, columns):
+        """
+        Returns the most recent non-NaN value strictly before `row` for each column,
+        scanning backwards in chunks so only the pages needed are touched.
+        """
+        values = np.full(len(columns), np.nan)
+        missing = np.arange(len(columns))
+        chunk = 64
+        end = row
+        while len(missing) and end > 0:
+            start = max(0, end - chunk)
+            block = self._fields[name][start:end][:, np.asarray(columns)[missing]]
+            valid = ~np.isnan(block)
+            has_valid = valid.any(axis=0)
+            if has_valid.any():
+                # Index of the last valid row in the block for each column
+                last_rows = block.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+                found = np.flatnonzero(has_valid)
+                values[missing[found]] = block[last_rows[found], found]
+                missing = missing[~has_valid]
+            end = start
+            chunk *= 2
+        return values
+
+    def to_downloaded_data(self, tickers=None, start_date=None, end_date=None):
+        """
+        Builds the same per-ticker dictionary that download_info.download_data returns,
+        for the requested tickers and date range, so the store can feed process_market_caps,
+        create_top_stocks_by_date and process directly.
+        """
+        tickers = self.tickers if tickers is None else tickers
+        i0, i1 = self.row_range(start_date, end_date)
+        dates = self.dates[i0:i1]
+        start_day = None if start_date is None else np.datetime64(pd.Timestamp(start_date).date(), 'D')
+        end_day = None if end_date is None else np.datetime64(pd.Timestamp(end_date).date(), 'D')
+
+        downloaded_data = {}
+        for ticker in tickers:
+            if ticker not in self.ticker_index:
+                print(f"{ticker} is not in the panel store.")
+                continue
+
+            frames = {}
+            for field, key, column in (('adjusted_close', 'prices', 'adjusted_close'), ('market_cap', 'market_cap', 'value')):
+                values = self._fields[field][i0:i1, self.ticker_index[ticker]]
+                mask = ~np.isnan(values)
+                frame = pd.DataFrame({column: values[mask]}, index=dates[mask])
+                frame.index.name = 'date'
+                frames[key] = frame
+
+            events = {}
+            for name in EVENT_FIELDS:
+                event_days = self.events(name, ticker)
+                if start_day is not None:
+                    event_days = event_days[event_days >= start_day]
+                if end_day is not None:
+                    event_days = event_days[event_days <= end_day]
+                events[name] = pd.DatetimeIndex(event_days.astype('datetime64[ns]'))
+
+            downloaded_data[ticker] = {
+                'prices': frames['prices'],
+                'price_status': 200 if not frames['prices'].empty else 404,
+                'earnings_dates': events['earnings_dates'].values,
+                'earnings_status': 200 if len(events['earnings_dates']) else 404,
+                'dividends': list(events['dividends']),
+                'dividends_status': 200 if len(events['dividends']) else 404,
+                'market_cap': frames['market_cap'],
+                'market_cap_status': 200 if not frames['market_cap'].empty else 404
+            }
+
+        return downloaded_data
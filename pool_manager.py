@@ -0,0 +1,120 @@
+import heapq
+
+# Pool bookkeeping for process.process.
+#
+# Free pools are kept in a heap ordered by the allocation policy, and open positions
+# in a heap ordered by sell date, so buying, finding the day's sales and selling cost
+# O(log pools) per trade instead of a scan over every pool.
+#
+# Allocation policies:
+#     first_free      the free pool with the lowest number (the original behaviour)
+#     richest_first   the free pool with the most capital
+#     split           free capital is shared: each buy gets an equal share of the total
+#                     free capital over the number of free pools
+
+ALLOCATION_POLICIES = ['first_free', 'richest_first', 'split']
+
+
+class PoolManager:
+    """
+    Tracks the free capital, open positions and pending sales of a set of pools.
+
+    Each pool holds at most one position. holdings maps a pool to its position:
+    {'ticker', 'amount', 'buy_date', 'sell_date', 'buy_price'}.
+    """
+
+    def __init__(self, initial_investment, num_pools, policy='first_free'):
+        if policy not in ALLOCATION_POLICIES:
+            raise ValueError(f"Unknown allocation policy '{policy}', expected one of {ALLOCATION_POLICIES}")
+        self.num_pools = num_pools
+        self.policy = policy
+        self.holdings = {}
+        self.holders = {}  # ticker -> set of pools holding it (for forced exits)
+        self.total_free_capital = initial_investment
+
+        # Per-pool free capital (in split mode only the shared total is used)
+        self._free_capital = [initial_investment / num_pools] * num_pools
+        # Only pools with capital to invest can take a trade (as in sell)
+        self._free = [self._free_key(i) for i in range(num_pools) if self._free_capital[i] > 0]
+        heapq.heapify(self._free)
+        self._num_free = num_pools
+        self._sales = []  # heap of (sell date, pool, position number)
+        self._position_numbers = [0] * num_pools  # Detects sales entries of positions closed early
+
+    def _free_key(self, pool):
+        if self.policy == 'richest_first':
+            return (-self._free_capital[pool], pool)
+        return (pool, pool)
+
+    def free_capital(self, pool):
+        # Free capital of one pool (0 while it holds a position)
+        if pool in self.holdings:
+            return 0
+        if self.policy == 'split':
+            return self.total_free_capital / self._num_free
+        return self._free_capital[pool]
+
+    def open_positions(self):
+        # (pool, position) pairs in pool order
+        return sorted(self.holdings.items())
+
+    def buy(self, ticker, date, sell_date, buy_price):
+        """
+        Invests in a ticker from the pool chosen by the allocation policy.
+
+        Returns:
+            tuple: (pool, amount invested), or None if no pool has free capital.
+        """
+        if not self._free:
+            return None
+        _, pool = heapq.heappop(self._free)
+
+        if self.policy == 'split':
+            amount = self.total_free_capital / self._num_free
+            self.total_free_capital -= amount
+        else:
+            amount = self._free_capital[pool]
+            self._free_capital[pool] = 0
+            self.total_free_capital -= amount
+        self._num_free -= 1
+
+        self.holdings[pool] = {'ticker': ticker, 'amount': amount, 'buy_date': date, 'sell_date': sell_date, 'buy_price': buy_price}
+        self.holders.setdefault(ticker, set()).add(pool)
+        self._position_numbers[pool] += 1
+        heapq.heappush(self._sales, (sell_date, pool, self._position_numbers[pool]))
+        return pool, amount
+
+    def due_sales(self, date, forced_tickers=()):
+        """
+        Pools to sell on a date: positions whose sell date has come, plus positions in
+        tickers that must be sold early. Returned in pool order.
+        """
+        pools = set()
+        while self._sales and self._sales[0][0] <= date:
+            _, pool, position_number = heapq.heappop(self._sales)
+            if pool in self.holdings and self._position_numbers[pool] == position_number:
+                pools.add(pool)
+        for ticker in forced_tickers:
+            pools.update(self.holders.get(ticker, ()))
+        return sorted(pools)
+
+    def sell(self, pool, sell_price):
+        """
+        Closes a pool's position and returns its capital to the free pools.
+
+        Returns:
+            tuple: (closed position, gain, total return)
+        """
+        position = self.holdings.pop(pool)
+        self.holders[position['ticker']].discard(pool)
+        investment_gain = (sell_price / position['buy_price'] - 1) * position['amount']
+        total_return = position['amount'] + investment_gain
+
+        self.total_free_capital += total_return
+        self._num_free += 1
+        if self.policy != 'split':
+            self._free_capital[pool] += total_return
+        # A pool that lost everything has nothing left to invest
+        if self.policy == 'split' or self._free_capital[pool] > 0:
+            heapq.heappush(self._free, self._free_key(pool))
+        return position, investment_gain, total_return
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import argparse
+import pandas as pd
+
+import download_info as di
+
+# Cache warm-up for configured ticker universes.
+#
+# Run from a scheduler (e.g. cron, before the working day) so that the downloads of
+# download_info.download_data are already in the cache when users ask for them:
+#
+#     python prefetch.py prefetch_config.example.json
+#     python prefetch.py prefetch_config.example.json --interval 360   # every 6 hours
+#
+# Config keys (JSON):
+#     api_key          EODHD key (or set the EODHD_API_KEY environment variable). Cache
+#                      files are per key, so use the key of the app's users.
+#     universes        list of {"name", "tickers", "windows": [{"start_date", "end_date"}]};
+#                      dates may be "today" or "yesterday", and should match the windows
+#                      users request (cache files are per date range)
+#     budget           maximum API calls per run (default 1000)
+#     costs            optional API calls per request by dataset (default 1 each)
+#     datasets         optional subset of download_info.DATASETS
+#     max_age_hours    cached windows that were still open when downloaded are refreshed
+#                      after this many hours (default 12)
+#     force_refresh    download every planned file again, even if cached (default false)
+#
+# Files are warmed in priority order: missing first, then stale, then forced refreshes;
+# within each group the most used tickers (download_info access stats) come first. The
+# progress and API calls used are written to a status file after every download (see
+# read_status, and the /prefetch/status route of the web app).
+
+STATUS_FILE = os.path.join(di.CACHE_DIR, "prefetch_status.json")
+DEFAULTS = {'budget': 1000, 'max_age_hours': 12, 'force_refresh': False}
+REASONS = ['missing', 'stale', 'forced']  # In priority order
+QUOTA_STATUS_CODES = (402, 429)  # The API refuses further calls
+
+
+def load_config(path):
+    with open(path, 'r') as f:
+        config = json.load(f)
+    config['api_key'] = config.get('api_key') or os.environ.get('EODHD_API_KEY')
+    if not config['api_key']:
+        raise ValueError("No API key: set api_key in the config or the EODHD_API_KEY environment variable")
+    for universe in config['universes']:
+        if isinstance(universe['tickers'], str):
+            universe['tickers'] = universe['tickers'].split(',')
+    return config
+
+
+def resolve_date(value, now):
+    # 'today' / 'yesterday' relative to now, anything else as given
+    if value == 'today':
+        return now.strftime('%Y-%m-%d')
+    if value == 'yesterday':
+        return (now - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    return value
+
+
+def plan_prefetch(config, stats=None, now=None, force_refresh=None):
+    """
+    Lists the downloads needed to warm the cache, in priority order.
+
+    A file is 'missing' if it is not cached, and 'stale' if it was downloaded before its
+    window ended (so later days may be missing) more than max_age_hours ago.
+
+    Args:
+        config (dict): Loaded config (see load_config).
+        stats (dict): Access stats (default: download_info.load_access_stats()).
+        now (pd.Timestamp): Current time (default: now).
+        force_refresh (bool): Overrides the config's force_refresh.
+
+    Returns:
+        list: Task dicts with ticker, dataset, url, cache_file, reason, usage and age_hours.
+    """
+    stats = di.load_access_stats() if stats is None else stats
+    now = now or pd.Timestamp.now()
+    force_refresh = config.get('force_refresh', DEFAULTS['force_refresh']) if force_refresh is None else force_refresh
+    max_age_hours = config.get('max_age_hours', DEFAULTS['max_age_hours'])
+    datasets = config.get('datasets', di.DATASETS)
+
+    tasks = {}
+    for universe in config['universes']:
+        for window in universe['windows']:
+            start_date = resolve_date(window['start_date'], now)
+            end_date = resolve_date(window['end_date'], now)
+            for ticker in universe['tickers']:
+                for dataset in datasets:
+                    url = di.dataset_url(dataset, ticker, start_date, end_date, config['api_key'])
+                    cache_file = di.cache_file_for_url(url)
+                    if cache_file is None or cache_file in tasks:
+                        continue
+
+                    age_hours = None
+                    if not os.path.exists(cache_file):
+                        reason = 'missing'
+                    else:
+                        modified = pd.Timestamp.fromtimestamp(os.path.getmtime(cache_file))
+                        age_hours = (now - modified).total_seconds() / 3600
+                        window_closed = modified >= pd.Timestamp(end_date) + pd.Timedelta(days=1)
+                        if not window_closed and age_hours > max_age_hours:
+                            reason = 'stale'
+                        elif force_refresh:
+                            reason = 'forced'
+                        else:
+                            continue  # Warm
+
+                    usage = stats.get(ticker, {})
+                    tasks[cache_file] = {'ticker': ticker, 'dataset': dataset, 'universe': universe.get('name'),
+                                         'start_date': start_date, 'end_date': end_date, 'url': url, 'cache_file': cache_file,
+                                         'reason': reason, 'usage': usage.get('hits', 0) + usage.get('misses', 0),
+                                         'age_hours': age_hours}
+
+    # Missing, then stale, then forced; within each, most used tickers first, then oldest files
+    return sorted(tasks.values(), key=lambda task: (REASONS.index(task['reason']), -task['usage'], -(task['age_hours'] or 0)))
+
+
+def write_status(status, status_file=STATUS_FILE):
+    status['updated_at'] = pd.Timestamp.now().isoformat(timespec='seconds')
+    os.makedirs(os.path.dirname(status_file) or '.', exist_ok=True)
+    di.write_cache(status_file, status)
+
+
+def read_status(status_file=STATUS_FILE):
+    # Latest prefetch status, or {'state': 'never_run'}
+    if not os.path.exists(status_file):
+        return {'state': 'never_run'}
+    with open(status_file, 'r') as f:
+        return json.load(f)
+
+
+def run_prefetch(config, status_file=STATUS_FILE, force_refresh=None):
+    """
+    Downloads the planned files until the plan or the API-call budget is used up.
+
+    Returns:
+        dict: Final status (also in status_file): state ('done', 'budget_exhausted',
+            'quota_exceeded', or 'failed' if the run itself stopped on an error), calls_used,
+            budget, completed, failed (with the status code or error of each file) and the
+            tasks left.
+    """
+    tasks = plan_prefetch(config, force_refresh=force_refresh)
+    budget = config.get('budget', DEFAULTS['budget'])
+    costs = config.get('costs', {})
+
+    status = {
+        'state': 'running',
+        'started_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'budget': budget,
+        'calls_used': 0,
+        'planned': len(tasks),
+        'planned_by_reason': {reason: sum(1 for task in tasks if task['reason'] == reason) for reason in REASONS},
+        'completed': 0,
+        'failed': [],
+        'current': None,
+        'remaining': len(tasks)
+    }
+    write_status(status, status_file)
+
+    try:
+        for number, task in enumerate(tasks):
+            cost = costs.get(task['dataset'], 1)
+            if status['calls_used'] + cost > budget:
+                status['state'] = 'budget_exhausted'
+                break
+
+            status['current'] = f"{task['ticker']} {task['dataset']} {task['start_date']} - {task['end_date']} ({task['reason']})"
+            write_status(status, status_file)
+            try:
+                _, status_code = di.download_and_cache_json(task['url'], force_refresh=True, count_access=False)
+                error = None
+            except Exception as e:  # e.g. a connection error: note it and carry on with the next file
+                status_code, error = None, f"{type(e).__name__}: {e}"
+            status['calls_used'] += cost  # A failed request may still have been counted by the API
+            status['remaining'] = len(tasks) - number - 1
+            if status_code == 200:
+                status['completed'] += 1
+            else:
+                status['failed'].append({'ticker': task['ticker'], 'dataset': task['dataset'], 'status_code': status_code, 'error': error})
+                if status_code in QUOTA_STATUS_CODES:
+                    status['state'] = 'quota_exceeded'
+                    break
+            write_status(status, status_file)
+        else:
+            status['state'] = 'done'
+    finally:
+        # A run that stopped on an unexpected error (or was interrupted) must not be
+        # reported as still running
+        if status['state'] == 'running':
+            status['state'] = 'failed'
+        status['current'] = None
+        status['next'] = [f"{task['ticker']} {task['dataset']} ({task['reason']})" for task in tasks[len(tasks) - status['remaining']:][:10]]
+        write_status(status, status_file)
+    print(f"Prefetch {status['state']}: {status['completed']} of {status['planned']} files downloaded, "
+          f"{len(status['failed'])} failed, {status['calls_used']}/{budget} API calls used.")
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the download cache for configured ticker universes.")
+    parser.add_argument('config', help="JSON config file")
+    parser.add_argument('--status-file', default=STATUS_FILE, help=f"Progress file (default: {STATUS_FILE})")
+    parser.add_argument('--force-refresh', action='store_true', help="Download every planned file again")
+    parser.add_argument('--interval', type=float, help="Keep running, starting a new prefetch every INTERVAL minutes")
+    args = parser.parse_args(argv)
+
+    while True:
+        run_prefetch(load_config(args.config), args.status_file, force_refresh=args.force_refresh or None)
+        if not args.interval:
+            return 0
+        time.sleep(args.interval * 60)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
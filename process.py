@@ -1,15 +1,21 @@
 # %%
 # Block 2: Data Retrieval
 
-import requests
-import io
+import os
+import pickle
+import itertools
+import numpy as np
 import pandas as pd
 
-import matplotlib
-matplotlib.use('Agg')  # Use a non-interactive backend like 'Agg' (for PNGs)
+import calendar_rules as cr
+import breakout_conditions as bc
+import pool_manager as pm
+import top_stocks as ts
 
 pd.set_option('display.max_rows', 20)  
 
+CHECKPOINT_VERSION = 2  # Layout of the checkpoint files written by process
+
 def calculate_strategy_metrics(investment_results, start_date, end_date, total_investment):
     total_days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days
     final_value = 0
@@ -40,6 +46,26 @@ def calculate_strategy_metrics(investment_results, start_date, end_date, total_i
     return metrics
 
 
+def investment_results_to_equity(investment_results):
+    """
+    Summarises the per-pool investment results into a daily equity table.
+
+    Returns:
+        pd.DataFrame: 'Free Capital', 'Invested' and 'Total' per date.
+    """
+    dates = []
+    free_capital = []
+    invested = []
+    for date, data in investment_results.items():
+        dates.append(date)
+        free_capital.append(sum([value for key, value in data.items() if "Free Capital" in key]))
+        invested.append(sum([value for key, value in data.items() if "Free Capital" not in key]))
+
+    equity = pd.DataFrame({'Free Capital': free_capital, 'Invested': invested}, index=pd.to_datetime(pd.Index(dates, name='Date')))
+    equity['Total'] = equity['Free Capital'] + equity['Invested']
+    return equity
+
+
 def process_market_caps(downloaded_data):
     market_caps_data = {}
 
@@ -99,88 +125,274 @@ def remove_tickers_without_dividends(downloaded_data):
 
     return downloaded_data
 
-def process(downloaded_data, top_stocks_by_date, days_after_dividend, days_before_earnings, initial_investment, num_pools):
+def _day_fingerprints(full_date_range, aligned_prices, membership, block_mask, exit_mask):
+    # One hash per day of everything the simulation reads on that day except the trade
+    # schedule (see _schedule_rows): prices of every ticker, the top stocks and the
+    # breakout masks. Built column-wise, so the cost does not grow with a per-day loop
+    tickers = list(aligned_prices)
+    prices = pd.DataFrame({ticker: prices['adjusted_close'] for ticker, prices in aligned_prices.items()}, index=full_date_range)
+
+    # Top stocks: one hash per change point, spread over the days it covers
+    member_hashes = pd.util.hash_array(np.array([','.join(stocks) for stocks in membership.members] + [''], dtype=object))
+    rows = np.searchsorted(membership.change_dates.values, full_date_range.values, side='right') - 1
+    rows[(rows < 0) | (full_date_range > membership.end)] = len(membership.members)  # No top stocks
+
+    day_inputs = {'prices': pd.util.hash_pandas_object(prices, index=False).to_numpy(), 'members': member_hashes[rows]}
+    for name, mask in (('blocked', block_mask), ('exits', exit_mask)):
+        if mask is not None:
+            mask = mask.reindex(index=full_date_range, columns=tickers, fill_value=False).astype(bool)
+            day_inputs[name] = pd.util.hash_pandas_object(mask, index=False).to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame(day_inputs), index=False).to_numpy()
+
+
+def _schedule_rows(schedule, full_date_range):
+    # The compiled trade schedule as one (buy day, ticker number, sell day) row per
+    # trade, sorted by buy day and then in schedule order like schedule_by_date
+    start = full_date_range[0].to_datetime64()
+    rows = [np.column_stack([(buy_dates - start) // np.timedelta64(1, 'D'), np.full(len(buy_dates), number),
+                             (sell_dates - start) // np.timedelta64(1, 'D')])
+            for number, (buy_dates, sell_dates) in enumerate(schedule.values())]
+    rows = np.concatenate(rows).astype(np.int64) if rows else np.empty((0, 3), dtype=np.int64)
+    return rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+
+
+def _first_changed_day(old_hashes, day_hashes, old_rows, trade_rows):
+    # First day from which a run on the new inputs can differ from the checkpointed one:
+    # the first day whose inputs hash differently (or the end of the shorter run), or the
+    # buy day of the first scheduled trade that was added, removed or now sells on
+    # another day (a later end date adds trades bought before the old end date)
+    num_days = min(len(old_hashes), len(day_hashes))
+    changed = np.flatnonzero(old_hashes[:num_days] != day_hashes[:num_days])
+    unchanged_days = changed[0] if len(changed) else num_days
+
+    old_rows = old_rows[old_rows[:, 0] < unchanged_days]
+    trade_rows = trade_rows[trade_rows[:, 0] < unchanged_days]
+    num_rows = min(len(old_rows), len(trade_rows))
+    changed = np.flatnonzero((old_rows[:num_rows] != trade_rows[:num_rows]).any(axis=1))
+    if len(changed):
+        unchanged_days = min(old_rows[changed[0], 0], trade_rows[changed[0], 0])
+    elif len(old_rows) != len(trade_rows):
+        unchanged_days = max(old_rows, trade_rows, key=len)[num_rows, 0]
+    return int(unchanged_days)
+
+
+def _read_checkpoint(checkpoint_path):
+    # The records of an append-only checkpoint file (see process), with the file offset
+    # after each one. A record cut short by an interrupted run ends the list
+    records = []
+    offsets = []
+    with open(checkpoint_path, 'rb') as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError, AttributeError):
+                print(f"Checkpoint {checkpoint_path} ends with an incomplete record, ignoring it.")
+                break
+            offsets.append(f.tell())
+    return records, offsets
+
+
+def _load_checkpoint(checkpoint_path, config, day_hashes, trade_rows):
+    """
+    Finds the latest snapshot of a previous run that the current run can resume from.
+
+    The checkpoint file holds a header with the run settings, followed by one segment
+    per snapshot (see process). The snapshot ending a segment after n days is usable if
+    the run settings match, the inputs of those n days hash the same as before and no
+    scheduled trade bought in them changed, so results are identical to a full run.
+
+    Returns:
+        dict: The state after the snapshot's last day ('num_days', 'state'), the results
+            up to it ('investment_results', 'free_capital_errors', 'trade_log') and the
+            file size to truncate the checkpoint to before appending; or None to start
+            from scratch.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    records, offsets = _read_checkpoint(checkpoint_path)
+
+    if not records or records[0].get('version') != CHECKPOINT_VERSION or records[0].get('config') != config:
+        print(f"Checkpoint {checkpoint_path} was made with different settings, starting from scratch.")
+        return None
+    segments = records[1:]
+    if not segments:
+        print(f"Checkpoint {checkpoint_path} has no snapshots, starting from scratch.")
+        return None
+
+    unchanged_days = _first_changed_day(np.concatenate([segment['day_hashes'] for segment in segments]), day_hashes,
+                                        np.concatenate([segment['trade_rows'] for segment in segments]), trade_rows)
+    usable = [number for number, segment in enumerate(segments) if segment['num_days'] <= unchanged_days]
+    if not usable:
+        print(f"Checkpoint {checkpoint_path} does not match the data, starting from scratch.")
+        return None
+
+    segments = segments[:usable[-1] + 1]
+    return {'num_days': segments[-1]['num_days'], 'state': segments[-1]['state'],
+            'investment_results': dict(itertools.chain.from_iterable(segment['investment_results'] for segment in segments)),
+            'free_capital_errors': [error for segment in segments for error in segment['free_capital_errors']],
+            'trade_log': [trade for segment in segments for trade in segment['trade_log']],
+            'size': offsets[usable[-1] + 1]}
+
+
+def _open_checkpoint(checkpoint_path, config, resume):
+    # Opens the checkpoint for appending segments: after the resumed snapshot (dropping
+    # the segments that are simulated again), or as a new file with only the header
+    checkpoint_dir = os.path.dirname(checkpoint_path)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    if resume is not None:
+        f = open(checkpoint_path, 'r+b')
+        f.truncate(resume['size'])
+        f.seek(resume['size'])
+    else:
+        f = open(checkpoint_path, 'wb')
+        pickle.dump({'version': CHECKPOINT_VERSION, 'config': config}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return f
+
+
+def process(downloaded_data, top_stocks_by_date, days_after_dividend, days_before_earnings, initial_investment, num_pools, entry_rule=None, exit_rule=None, block_mask=None, exit_mask=None, trade_log=None, checkpoint_path=None,
+            allocation='first_free', record_pool_capital=True):
+    # block_mask/exit_mask: optional breakout masks (see breakout_conditions.build_masks),
+    # or their breakout_conditions.mask_to_lookup lookups to convert them only once per sweep
+    # trade_log: optional list that every buy and sell is appended to (for headless runs)
+    # allocation: which free pool a buy uses, see pool_manager.ALLOCATION_POLICIES
+    # record_pool_capital: record every pool's free capital each day; set to False with
+    # many pools to record a single "Free Capital" total instead
+    # checkpoint_path: optional file to save the simulation state to, and to resume from
+    # on the next run (e.g. when the end date moves forward by a day). Only days whose
+    # data changed since the checkpoint are simulated again, and only their results and
+    # snapshots are appended to the file.
+    # Entry/exit rules default to buying days_after_dividend after the ex-dividend date
+    # and selling days_before_earnings before the next earnings date (see calendar_rules)
+    default_entry_rule, default_exit_rule = cr.default_rules(days_after_dividend, days_before_earnings)
+    entry_rule = entry_rule or default_entry_rule
+    exit_rule = exit_rule or default_exit_rule
+
     # Initialize pools and their states based on the number of pools
-    free_capital_pools = [initial_investment/num_pools] * num_pools
-    active_investments = {i: {} for i in range(num_pools)}
-    pending_sales = {i: {} for i in range(num_pools)}
-    pool_availability = [True] * num_pools
+    state = {'pools': pm.PoolManager(initial_investment, num_pools, allocation)}
     investment_results = {}
     free_capital_errors = []  # List to store tickers and dates of "no free capital" errors
 
+    # Top stocks as change points (a create_top_stocks_by_date frame is converted)
+    membership = ts.as_membership(top_stocks_by_date)
+
     # Generate a full date range (including non-trading days)
-    full_date_range = pd.date_range(start=top_stocks_by_date.index.min(), end=top_stocks_by_date.index.max(), freq='D')
+    full_date_range = pd.date_range(start=membership.first_date, end=membership.last_date, freq='D')
+
+    # Compile the trade schedule once, on the real trading days (before forward-filling),
+    # so buy and sell dates that fall on weekends/holidays roll to an actual price
+    schedule = cr.compile_trade_schedule(downloaded_data, entry_rule, exit_rule, full_date_range[0], full_date_range[-1])
+
+    # Breakout masks (see breakout_conditions.build_masks) as {date: suspended tickers};
+    # lookups converted beforehand with breakout_conditions.mask_to_lookup are used as they are
+    blocked_by_date = bc.mask_to_lookup(block_mask)
+    exits_by_date = bc.mask_to_lookup(exit_mask)
 
     # Forward-fill price data for each stock across all dates
-    for ticker, data in downloaded_data.items():
-        data['prices'] = data['prices'].reindex(full_date_range).ffill()
+    aligned_prices = {ticker: data['prices'].reindex(full_date_range).ffill() for ticker, data in downloaded_data.items()}
+
+    first_day = 0
+    if checkpoint_path:
+        if trade_log is None:
+            trade_log = []  # Kept in the checkpoint, so a resumed run can return the full log
+        # Finding the resume point needs the inputs of every day, but only as arrays
+        # compared in one go; the simulation itself starts from the resume point
+        day_hashes = _day_fingerprints(full_date_range, aligned_prices, membership, blocked_by_date.mask, exits_by_date.mask)
+        trade_rows = _schedule_rows(schedule, full_date_range)
+        checkpoint_config = {'start_date': full_date_range[0], 'tickers': list(aligned_prices), 'initial_investment': initial_investment,
+                             'num_pools': num_pools, 'entry_rule': entry_rule, 'exit_rule': exit_rule,
+                             'allocation': allocation, 'record_pool_capital': record_pool_capital}
+        resume = _load_checkpoint(checkpoint_path, checkpoint_config, day_hashes, trade_rows)
+        if resume is not None:
+            # Restore the state after the snapshot's last day, and the results up to it
+            first_day = resume['num_days']
+            state = resume['state']
+            investment_results = resume['investment_results']
+            free_capital_errors = resume['free_capital_errors']
+            trade_log.extend(resume['trade_log'])
+            print(f"Resuming from checkpoint: {first_day} of {len(full_date_range)} days already simulated.")
+        checkpoint_file = _open_checkpoint(checkpoint_path, checkpoint_config, resume)
+        segment_start, errors_start, trades_start = first_day, len(free_capital_errors), len(trade_log)
+
+    # Buys by date, only from the first simulated day on
+    first_buy = full_date_range[first_day].to_datetime64()
+    trades_by_date = cr.schedule_by_date({ticker: (buy_dates[buy_dates >= first_buy], sell_dates[buy_dates >= first_buy])
+                                          for ticker, (buy_dates, sell_dates) in schedule.items()})
+
+    pools = state['pools']
 
     # Iterate over each date in the full range (including non-trading days)
-    for date in full_date_range:
+    for day, date in enumerate(full_date_range[first_day:], start=first_day):
         date_str = date.strftime('%Y-%m-%d')
         investment_results[date_str] = {}
 
-        # Print diagnostics for the start of each day (per pool)
-        for i in range(num_pools):
-            investment_results[date_str][f"Pool {i} Free Capital"] = free_capital_pools[i]
-
-            if active_investments[i]:
-                for ticker, investment_value in active_investments[i].items():
+        # Record the value of each pool at the start of the day, or with
+        # record_pool_capital=False only the total free capital and the open positions
+        # (so the cost per day follows the number of positions, not pools)
+        if record_pool_capital:
+            for i in range(num_pools):
+                investment_results[date_str][f"Pool {i} Free Capital"] = pools.free_capital(i)
+                if i in pools.holdings:
+                    position = pools.holdings[i]
                     # Use the last valid price (forward-filled) for non-trading days
-                    current_price = downloaded_data[ticker]['prices'].loc[date, 'adjusted_close']
-                    current_investment_value = (investment_value / pending_sales[i]['buy_price']) * current_price
-                    investment_results[date_str][f"Pool {i} - {ticker}"] = current_investment_value
-
-        # Process sales for the day (if any pending sales are due)
-        for i in range(num_pools):
-            if pending_sales[i] and pending_sales[i]['sell_date'] == date:
-                prices = downloaded_data[pending_sales[i]['ticker']]['prices']
-                sell_price = prices.loc[date, 'adjusted_close']
-                buy_price = pending_sales[i]['buy_price']
-                investment_gain = (sell_price / buy_price - 1) * active_investments[i][pending_sales[i]['ticker']]
-                total_return = active_investments[i][pending_sales[i]['ticker']] + investment_gain
-                print(f"{date_str}: Sold: {pending_sales[i]['ticker']}, Pool: {i}, Gain: ${investment_gain:.2f}, Total Return: ${total_return:.2f}")
-                free_capital_pools[i] += total_return
-                active_investments[i].pop(pending_sales[i]['ticker'])
-                pending_sales[i] = {}
-                pool_availability[i] = True
-
-        # Check if it's a valid trading day and process possible buys
-        if date in top_stocks_by_date.index:
-            current_top_stocks = top_stocks_by_date.loc[date, 'Stock']
-
-            for ticker, data in downloaded_data.items():
-                if ticker not in current_top_stocks:
-                    continue  # Skip stocks that are not in the top list for the current date
-
-                prices = data['prices']
-                dividends = data['dividends']
-                earnings_dates = [pd.Timestamp(d) for d in data['earnings_dates']]
-
-                for ex_dividend_date in dividends:
-                    ex_dividend_date = pd.Timestamp(ex_dividend_date)
-                    intended_buy_date = ex_dividend_date + pd.DateOffset(days=days_after_dividend)
-                    if intended_buy_date == date:
-                        valid_earnings_dates = [ed for ed in earnings_dates if ed > intended_buy_date]
-                        if not valid_earnings_dates:
-                            continue
-                        intended_sell_date = min(valid_earnings_dates) - pd.DateOffset(days=days_before_earnings)
-                        if intended_sell_date in prices.index:
-                            buy_price = prices.loc[intended_buy_date, 'adjusted_close']
-                            bought = False  # Track if any pool successfully buys
-                            for i in range(num_pools):
-                                if free_capital_pools[i] > 0 and pool_availability[i]:
-                                    amount_to_invest = free_capital_pools[i]
-                                    active_investments[i][ticker] = amount_to_invest
-                                    free_capital_pools[i] = 0
-                                    pool_availability[i] = False
-                                    print(f"{date_str}: Bought: {ticker}, Pool: {i}, Investment: ${amount_to_invest:.2f}")
-                                    pending_sales[i] = {'ticker': ticker, 'buy_date': intended_buy_date, 'sell_date': intended_sell_date, 'buy_price': buy_price}
-                                    bought = True
-                                    break
-                            if not bought:
-                                print(f"*** No free capital for {ticker} on {date_str}")
-                                free_capital_errors.append((ticker, date_str))  # Log the no free capital error
+                    current_price = aligned_prices[position['ticker']].loc[date, 'adjusted_close']
+                    investment_results[date_str][f"Pool {i} - {position['ticker']}"] = (position['amount'] / position['buy_price']) * current_price
+        else:
+            investment_results[date_str]["Free Capital"] = pools.total_free_capital
+            for i, position in pools.open_positions():
+                current_price = aligned_prices[position['ticker']].loc[date, 'adjusted_close']
+                investment_results[date_str][f"Pool {i} - {position['ticker']}"] = (position['amount'] / position['buy_price']) * current_price
+
+        # Process sales for the day: positions due today, and positions sold early
+        # because a breakout exit condition was triggered
+        exit_tickers = exits_by_date.get(date, ())
+        for i in pools.due_sales(date, exit_tickers):
+            ticker = pools.holdings[i]['ticker']
+            forced_exit = ticker in exit_tickers
+            sell_price = aligned_prices[ticker].loc[date, 'adjusted_close']
+            _, investment_gain, total_return = pools.sell(i, sell_price)
+            print(f"{date_str}: Sold: {ticker}, Pool: {i}, Gain: ${investment_gain:.2f}, Total Return: ${total_return:.2f}{' (forced exit)' if forced_exit else ''}")
+            if trade_log is not None:
+                trade_log.append({'date': date, 'action': 'sell', 'ticker': ticker, 'pool': i,
+                                  'price': sell_price, 'amount': total_return, 'gain': investment_gain, 'forced_exit': forced_exit})
+
+        # Process possible buys
+        for ticker, intended_sell_date in trades_by_date.get(date, []):
+            if not membership.is_member(ticker, date):
+                continue  # Skip stocks that are not in the top list for the current date
+            if ticker in blocked_by_date.get(date, ()):
+                print(f"{date_str}: Suspended: {ticker} (breakout condition)")
+                continue
+
+            buy_price = aligned_prices[ticker].loc[date, 'adjusted_close']
+            bought = pools.buy(ticker, date, intended_sell_date, buy_price)  # (pool, amount) or None
+            if bought:
+                i, amount_to_invest = bought
+                print(f"{date_str}: Bought: {ticker}, Pool: {i}, Investment: ${amount_to_invest:.2f}")
+                if trade_log is not None:
+                    trade_log.append({'date': date, 'action': 'buy', 'ticker': ticker, 'pool': i,
+                                      'price': buy_price, 'amount': amount_to_invest, 'gain': 0.0, 'forced_exit': False})
+            else:
+                print(f"*** No free capital for {ticker} on {date_str}")
+                free_capital_errors.append((ticker, date_str))  # Log the no free capital error
+
+        # Snapshot the state at every month end and on the last day, so a later run can
+        # resume from the latest snapshot before any day whose data changed. Each snapshot
+        # is appended to the checkpoint with the days simulated since the previous one
+        if checkpoint_path and (date.is_month_end or day == len(full_date_range) - 1):
+            dates = full_date_range[segment_start:day + 1].strftime('%Y-%m-%d')
+            segment_rows = (trade_rows[:, 0] >= segment_start) & (trade_rows[:, 0] <= day)
+            pickle.dump({'num_days': day + 1, 'day_hashes': day_hashes[segment_start:day + 1], 'trade_rows': trade_rows[segment_rows],
+                         'investment_results': [(date_str, investment_results[date_str]) for date_str in dates],
+                         'free_capital_errors': free_capital_errors[errors_start:], 'trade_log': trade_log[trades_start:],
+                         'state': state}, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            checkpoint_file.flush()
+            segment_start, errors_start, trades_start = day + 1, len(free_capital_errors), len(trade_log)
+
+    if checkpoint_path:
+        checkpoint_file.close()
 
     return investment_results, free_capital_errors  # Return the results and the list of no free capital errors
 
@@ -0,0 +1,216 @@
+import os
+import datetime
+
+# Columnar export of simulation results (for the web app's results endpoints).
+#
+# Each table is produced as a sequence of pyarrow RecordBatches built straight from
+# the simulation output, a batch of days at a time, so large results never need the
+# transposed per-pool DataFrame that chart_combined builds. Batches can be streamed
+# as Arrow IPC, Parquet or JSON, or written to Arrow IPC files (write_tables) and
+# streamed from there later (stream_stored_table).
+#
+# Tables:
+#     equity               date, free_capital, invested, total (one row per day)
+#     holdings             date, pool, ticker, value (one row per pool position or free
+#                          capital entry per day; ticker is null for free capital, pool
+#                          is null for the total when pools were not recorded separately)
+#     trades               the trade_log of process.process
+#     free_capital_errors  ticker, date
+#     returns              the per-ticker table of calculate_returns
+#
+# pyarrow is only imported when a table is exported.
+
+TABLES = ['equity', 'holdings', 'trades', 'free_capital_errors', 'returns']
+FORMATS = {'arrow': 'application/vnd.apache.arrow.stream', 'parquet': 'application/vnd.apache.parquet', 'json': 'application/json'}
+BATCH_DAYS = 256  # Days of results per record batch
+
+
+def schema(name):
+    import pyarrow as pa
+    fields = {
+        'equity': [('date', pa.date32()), ('free_capital', pa.float64()), ('invested', pa.float64()), ('total', pa.float64())],
+        'holdings': [('date', pa.date32()), ('pool', pa.int32()), ('ticker', pa.string()), ('value', pa.float64())],
+        'trades': [('date', pa.date32()), ('action', pa.string()), ('ticker', pa.string()), ('pool', pa.int32()),
+                   ('price', pa.float64()), ('amount', pa.float64()), ('gain', pa.float64()), ('forced_exit', pa.bool_())],
+        'free_capital_errors': [('ticker', pa.string()), ('date', pa.date32())],
+        'returns': [('ticker', pa.string()), ('start_price', pa.float64()), ('end_price', pa.float64()),
+                    ('percent_return', pa.float64()), ('annual_return', pa.float64())]
+    }
+    if name not in fields:
+        raise ValueError(f"Unknown table '{name}', expected one of {TABLES}")
+    return pa.schema(fields[name])
+
+
+def _to_date(value):
+    # 'YYYY-MM-DD' strings and Timestamps to datetime.date
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value.date() if hasattr(value, 'date') else value
+
+
+def _parse_result_key(key):
+    # "Pool 3 Free Capital" -> (3, None), "Pool 3 - KHC.US" -> (3, 'KHC.US'), "Free Capital" -> (None, None)
+    if key == "Free Capital":
+        return None, None
+    pool, _, rest = key[len("Pool "):].partition(" ")
+    if rest == "Free Capital":
+        return int(pool), None
+    return int(pool), rest[len("- "):]
+
+
+def _batches_from_rows(name, rows, batch_size=BATCH_DAYS):
+    # Groups an iterator of row tuples into record batches of the table's schema
+    import pyarrow as pa
+    table_schema = schema(name)
+    columns = [[] for _ in table_schema]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= batch_size:
+            yield pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, table_schema)], schema=table_schema)
+            columns = [[] for _ in table_schema]
+    if columns[0]:
+        yield pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, table_schema)], schema=table_schema)
+
+
+def table_batches(run, name):
+    """
+    Record batches of one result table.
+
+    Args:
+        run (dict): Results of a completed run, with investment_results,
+            free_capital_errors, trade_log and returns_data.
+        name (str): One of TABLES.
+
+    Returns:
+        iterator: pyarrow.RecordBatch objects.
+    """
+    schema(name)  # Raises for unknown tables
+    if name == 'equity':
+        def rows():
+            for date, data in run['investment_results'].items():
+                free_capital = sum([value for key, value in data.items() if "Free Capital" in key])
+                invested = sum([value for key, value in data.items() if "Free Capital" not in key])
+                yield _to_date(date), free_capital, invested, free_capital + invested
+        return _batches_from_rows(name, rows())
+    if name == 'holdings':
+        def rows():
+            for date, data in run['investment_results'].items():
+                day = _to_date(date)
+                for key, value in data.items():
+                    pool, ticker = _parse_result_key(key)
+                    yield day, pool, ticker, value
+        # Several rows per day, so larger batches
+        return _batches_from_rows(name, rows(), BATCH_DAYS * 16)
+    if name == 'trades':
+        return _batches_from_rows(name, ((_to_date(t['date']), t['action'], t['ticker'], t['pool'], t['price'], t['amount'], t['gain'], t['forced_exit'])
+                                         for t in run['trade_log']))
+    if name == 'free_capital_errors':
+        return _batches_from_rows(name, ((ticker, _to_date(date)) for ticker, date in run['free_capital_errors']))
+    return _batches_from_rows(name, ((r['ticker'], r['start_price'], r['end_price'], r['percent_return'], r['annual_return'])
+                                     for r in run['returns_data']))
+
+
+class _ChunkSink:
+    # Write-only file object that hands out what has been written since the last call,
+    # so Arrow/Parquet writers can feed a streamed HTTP response
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def write_tables(run, run_dir):
+    """
+    Writes every table of a completed run to <run_dir>/<table>.arrow (Arrow IPC files),
+    so it can be served later without keeping the run in memory.
+
+    Args:
+        run (dict): Results of a completed run (see table_batches).
+        run_dir (str): Existing directory for the files.
+    """
+    import pyarrow as pa
+    for name in TABLES:
+        with pa.OSFile(os.path.join(run_dir, f"{name}.arrow"), 'wb') as sink, pa.ipc.new_file(sink, schema(name)) as writer:
+            for batch in table_batches(run, name):
+                writer.write_batch(batch)
+
+
+def stored_table_batches(run_dir, name):
+    # Record batches of a table written by write_tables, read through a memory map
+    import pyarrow as pa
+    schema(name)  # Raises for unknown tables
+    reader = pa.ipc.open_file(pa.memory_map(os.path.join(run_dir, f"{name}.arrow")))
+    return (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+
+def stream_table(run, name, output_format):
+    """
+    Streams one result table as bytes in the requested format.
+
+    Args:
+        run (dict): Results of a completed run (see table_batches).
+        name (str): One of TABLES.
+        output_format (str): 'arrow' (IPC stream), 'parquet' or 'json' (list of records).
+
+    Returns:
+        iterator: Chunks of bytes, one or more per record batch.
+    """
+    return _stream_batches(table_batches(run, name), name, output_format)
+
+
+def stream_stored_table(run_dir, name, output_format):
+    # Same as stream_table, for a table written by write_tables
+    return _stream_batches(stored_table_batches(run_dir, name), name, output_format)
+
+
+def _stream_batches(batches, name, output_format):
+    # Encodes record batches of a table as chunks of bytes in the requested format
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown format '{output_format}', expected one of {list(FORMATS)}")
+    table_schema = schema(name)
+
+    if output_format == 'json':
+        import json
+        yield b'['
+        separator = ''
+        for batch in batches:
+            # NaN is not valid JSON, so it is written as null
+            records = [{key: None if value != value else value for key, value in record.items()} for record in batch.to_pylist()]
+            yield (separator + json.dumps(records, default=str)[1:-1]).encode('utf-8')
+            separator = ','
+        yield b']'
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, table_schema) if output_format == 'arrow' else pq.ParquetWriter(sink, table_schema)
+    for batch in batches:
+        if output_format == 'arrow':
+            writer.write_batch(batch)
+        else:
+            writer.write_table(pa.Table.from_batches([batch], schema=table_schema))  # One row group per batch
+        yield sink.take()
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,49 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+START_DATE = '2019-09-09'
+END_DATE = '2022-09-09'
+
+
+def make_downloaded_data(num_tickers=8, start_date=START_DATE, end_date=END_DATE, seed=0):
+    """
+    Synthetic data in the form download_info.download_data returns: random-walk prices
+    on business days, weekly market caps, quarterly dividends and earnings 40 days
+    after each dividend (so some fall on weekends).
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start_date, end_date, name='date')
+    downloaded_data = {}
+    for k in range(num_tickers):
+        prices = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(days))))
+        weeks = days[::5]
+        dividends = list(pd.date_range(pd.Timestamp(start_date) + pd.Timedelta(days=int(rng.integers(0, 60))), end_date, freq='91D'))
+        downloaded_data[f"T{k:02d}.US"] = {
+            'prices': pd.DataFrame({'adjusted_close': prices}, index=days),
+            'price_status': 200,
+            'earnings_dates': pd.DatetimeIndex([date + pd.Timedelta(days=40) for date in dividends]).values,
+            'earnings_status': 200,
+            'dividends': dividends,
+            'dividends_status': 200,
+            'market_cap': pd.DataFrame({'value': prices[::5] * 1e9 * (1 + k / 10)}, index=weeks),
+            'market_cap_status': 200
+        }
+    return downloaded_data
+
+
+@pytest.fixture(scope='session')
+def downloaded_data():
+    return make_downloaded_data()
+
+
+@pytest.fixture(scope='session')
+def top_stocks(downloaded_data):
+    import process
+    import top_stocks as ts
+    return ts.create_top_stocks_membership(process.process_market_caps(downloaded_data), START_DATE, END_DATE, 5)
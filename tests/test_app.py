@@ -0,0 +1,56 @@
+import io
+import json
+import pyarrow as pa
+import pytest
+
+import app
+import process
+from conftest import START_DATE, END_DATE
+
+
+@pytest.fixture
+def completed_run(downloaded_data, top_stocks):
+    trade_log = []
+    investment_results, free_capital_errors = process.process(downloaded_data, top_stocks, 1, 1, 1000, 3, trade_log=trade_log)
+    return {
+        'parameters': {'tickers': list(downloaded_data), 'start_date': START_DATE, 'end_date': END_DATE},
+        'metrics': process.calculate_strategy_metrics(investment_results, START_DATE, END_DATE, 1000),
+        'average_stock_return': 10.0,
+        'average_stock_annual_return': 3.0,
+        'first_valid_date': None,
+        'last_valid_date': None,
+        'investment_results': investment_results,
+        'free_capital_errors': free_capital_errors,
+        'trade_log': trade_log,
+        'returns_data': []
+    }
+
+
+@pytest.fixture
+def runs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'RUNS_DIR', str(tmp_path / 'runs'))
+    return tmp_path / 'runs'
+
+
+def test_stored_run_is_served_from_disk(completed_run, runs_dir):
+    run_id = app.store_run(completed_run)
+    client = app.app.test_client()
+
+    summary = client.get(f"/results/{run_id}").get_json()
+    assert summary['num_days'] == len(completed_run['investment_results'])
+    assert summary['num_trades'] == sum(1 for trade in completed_run['trade_log'] if trade['action'] == 'buy')
+
+    trades = json.loads(client.get(f"/results/{run_id}/trades.json").data)
+    assert [trade['ticker'] for trade in trades] == [trade['ticker'] for trade in completed_run['trade_log']]
+    equity = pa.ipc.open_stream(io.BytesIO(client.get(f"/results/{run_id}/equity.arrow").data)).read_all()
+    expected = process.investment_results_to_equity(completed_run['investment_results'])
+    assert equity['total'].to_pylist() == pytest.approx(expected['Total'].tolist())
+
+    assert client.get("/results/../results").status_code == 404
+    assert client.get(f"/results/{'0' * 32}").status_code == 404
+
+
+def test_only_latest_runs_are_kept(completed_run, runs_dir, monkeypatch):
+    monkeypatch.setattr(app, 'MAX_STORED_RUNS', 2)
+    run_ids = [app.store_run(completed_run) for _ in range(3)]
+    assert sorted(path.name for path in runs_dir.iterdir()) == sorted(run_ids[1:])
@@ -0,0 +1,30 @@
+import pytest
+
+import batch_runner as br
+
+
+def test_grid_covers_every_combination():
+    runs = br.expand_grid({'days_after_dividend': [0, 1, 2], 'days_before_earnings': [0, 2], 'num_pools': 5})
+    assert len(runs) == 6
+    assert all(run['num_pools'] == 5 and run['num_stocks'] == br.DEFAULTS['num_stocks'] for run in runs)
+
+
+def test_rules_replace_their_parameters():
+    runs = br.expand_grid({'entry_rule': {'anchor': 'month_start'}, 'days_before_earnings': [0, 2]})
+    assert len(runs) == 2
+    assert all('days_after_dividend' not in run for run in runs)
+
+    with pytest.raises(ValueError):
+        br.expand_grid({'entry_rule': {'anchor': 'month_start'}, 'days_after_dividend': [0, 1, 2]})
+    with pytest.raises(ValueError):
+        br.expand_grid({'exit_rule': {'anchor': 'earnings', 'offset': -1}, 'days_before_earnings': 1})
+
+
+def test_checkpoint_names_keep_configs_apart():
+    params = br.expand_grid({})[0]
+    name = br.checkpoint_name({}, '2020-01-01', params)
+    assert name == br.checkpoint_name({'allocation': 'first_free', 'end_date': '2021-01-01'}, '2020-01-01', params)
+
+    for settings in [{'entry_rule': {'anchor': 'month_start'}}, {'exit_rule': {'anchor': 'earnings', 'offset': -1}},
+                     {'allocation': 'richest_first'}, {'breakout_conditions': [{'type': 'gap_down'}]}]:
+        assert br.checkpoint_name(settings, '2020-01-01', params) != name
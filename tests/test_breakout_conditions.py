@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import breakout_conditions as bc
+import process
+
+DATES = pd.date_range('2021-01-01', periods=40, freq='D')
+
+
+def frames(prices):
+    # raw and daily price frames as price_frames builds them, from a {ticker: prices} dict
+    # of daily values (NaN for days without a price)
+    raw = pd.DataFrame(prices, index=DATES)
+    raw = raw.loc[raw.notna().any(axis=1)]
+    return raw, raw.reindex(DATES).ffill()
+
+
+def test_price_drop():
+    prices = np.full(40, 100.0)
+    prices[20:] = 85.0
+    mask = bc.price_drop(*frames({'A': prices}), days=5, threshold=0.10)
+    assert list(DATES[mask['A'].to_numpy()]) == list(DATES[20:25])
+
+
+def test_volatility_spike():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.001, 40)
+    returns[30:] = rng.normal(0, 0.05, 10)
+    mask = bc.volatility_spike(*frames({'A': 100 * np.cumprod(1 + returns)}), window=5, baseline=30, multiple=2.0)
+    # Flagged from the first volatile day until the long-run level catches up
+    assert list(DATES[mask['A'].to_numpy()]) == list(DATES[30:35])
+
+
+def test_market_drawdown_applies_to_all_tickers():
+    prices = np.full(40, 100.0)
+    prices[10:] = 80.0
+    mask = bc.market_drawdown(*frames({'A': prices, 'B': prices.copy()}), threshold=0.15)
+    assert mask.loc[DATES[10:], ['A', 'B']].to_numpy().all()
+    assert not mask.loc[DATES[:10]].to_numpy().any()
+
+
+def test_data_gap():
+    prices = np.full(40, 100.0)
+    prices[10:20] = np.nan
+    mask = bc.data_gap(*frames({'A': prices, 'B': np.full(40, 50.0)}), max_gap_days=7)
+    # The last price before the gap is on day 9, so days 17 to 19 are more than 7 days after it
+    assert list(DATES[mask['A'].to_numpy()]) == list(DATES[17:20])
+    assert not mask['B'].any()
+
+
+def test_blackout():
+    mask = bc.blackout(*frames({'A': np.full(40, 1.0), 'B': np.full(40, 1.0)}), periods=[('2021-01-05', '2021-01-06'), '2021-01-20'], tickers=['B'])
+    assert not mask['A'].any()
+    assert list(mask.index[mask['B']]) == [pd.Timestamp('2021-01-05'), pd.Timestamp('2021-01-06'), pd.Timestamp('2021-01-20')]
+
+
+def test_build_masks_blocks_exit_conditions(downloaded_data):
+    conditions = [bc.breakout_condition('blackout', 'block', periods=[('2020-01-01', '2020-01-31')], tickers=['T00.US']),
+                  bc.breakout_condition('blackout', 'exit', periods=[('2021-01-01', '2021-01-31')], tickers=['T01.US'])]
+    block_mask, exit_mask = bc.build_masks(downloaded_data, conditions, '2019-09-09', '2022-09-09')
+    assert block_mask['T00.US'].sum() == 31 and not exit_mask['T00.US'].any()
+    assert block_mask['T01.US'].sum() == 31 and exit_mask['T01.US'].sum() == 31
+
+
+def test_mask_to_lookup():
+    mask = pd.DataFrame(False, index=DATES, columns=['A', 'B'])
+    mask.loc[DATES[3], ['A', 'B']] = True
+    lookup = bc.mask_to_lookup(mask)
+    assert lookup == {DATES[3]: {'A', 'B'}}
+    assert lookup.mask is mask
+    assert bc.mask_to_lookup(lookup) is lookup
+    assert bc.mask_to_lookup(None) == {} and bc.as_mask(bc.mask_to_lookup(None)) is None
+
+
+def run_process(downloaded_data, top_stocks, **masks):
+    trade_log = []
+    investment_results, _ = process.process(downloaded_data, top_stocks, 0, 0, 1000, 5, trade_log=trade_log, **masks)
+    return investment_results, trade_log
+
+
+def test_block_mask_skips_buys(downloaded_data, top_stocks):
+    _, trade_log = run_process(downloaded_data, top_stocks)
+    ticker = next(trade['ticker'] for trade in trade_log if trade['action'] == 'buy')
+    mask = pd.DataFrame(False, index=pd.date_range('2019-09-09', '2022-09-09'), columns=list(downloaded_data))
+    mask[ticker] = True
+
+    investment_results, blocked_log = run_process(downloaded_data, top_stocks, block_mask=mask)
+    assert not [trade for trade in blocked_log if trade['ticker'] == ticker]
+    assert [trade for trade in blocked_log if trade['action'] == 'buy']  # Other tickers are still bought
+
+    # A lookup converted beforehand gives the same run
+    assert run_process(downloaded_data, top_stocks, block_mask=bc.mask_to_lookup(mask)) == (investment_results, blocked_log)
+
+
+def test_exit_mask_forces_sales(downloaded_data, top_stocks):
+    _, trade_log = run_process(downloaded_data, top_stocks)
+    buy = next(trade for trade in trade_log if trade['action'] == 'buy')
+    sell = next(trade for trade in trade_log if trade['action'] == 'sell' and trade['pool'] == buy['pool'])
+    exit_day = buy['date'] + pd.Timedelta(days=2)
+    assert exit_day < sell['date']
+    mask = pd.DataFrame(False, index=pd.date_range('2019-09-09', '2022-09-09'), columns=list(downloaded_data))
+    mask.loc[exit_day, buy['ticker']] = True
+
+    _, exit_log = run_process(downloaded_data, top_stocks, block_mask=mask, exit_mask=mask)
+    forced = [trade for trade in exit_log if trade['forced_exit']]
+    assert [(trade['date'], trade['ticker'], trade['pool']) for trade in forced] == [(exit_day, buy['ticker'], buy['pool'])]
@@ -0,0 +1,90 @@
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+
+import bulk_ingest as bi
+import download_info as di
+import panel_store as ps
+
+# Recorded API responses for three US tickers from 2024-06-03 to 2024-07-12:
+#   backfill/  per-ticker history as the API returned it on 2024-06-28
+#   latest/    per-ticker history as of 2024-07-12 (re-adjusted for a 2:1 BBB split on
+#              2024-07-08 and an AAA dividend on 2024-07-10), plus the bulk days since
+#              2024-06-28 (2024-07-04 is a holiday and has no bulk file)
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'bulk')
+TICKERS = ['AAA.US', 'BBB.US', 'CCC.US']
+
+
+@pytest.fixture
+def serve(monkeypatch, tmp_path):
+    # Starts stand-in servers and points download_info at them; downloads are cached under tmp_path
+    monkeypatch.chdir(tmp_path)
+    servers = []
+
+    def start(directory):
+        server = bi.serve_recorded_bulk(directory, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(di, 'API_BASE_URL', f"http://127.0.0.1:{server.server_address[1]}/api")
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_update_matches_full_backfill(serve, tmp_path):
+    latest = tmp_path / 'latest'
+    shutil.copytree(os.path.join(FIXTURES, 'latest'), latest)
+    store_dir = str(tmp_path / 'store')
+
+    serve(os.path.join(FIXTURES, 'backfill'))
+    bi.create_store(store_dir, 'demo', TICKERS, '2024-06-03', '2024-06-28')
+
+    # 2024-07-12 is not published yet: the API still answers with the previous day
+    serve(str(latest))
+    bulk_dir = latest / 'eod-bulk-last-day' / 'US'
+    published = (bulk_dir / '2024-07-12.json').read_text()
+    (bulk_dir / '2024-07-12.json').write_text((bulk_dir / '2024-07-11.json').read_text())
+
+    result = bi.update_store(store_dir, 'demo', end_date='2024-07-12')
+    assert result['appended'] == 8
+    assert result['skipped'] == ['2024-07-04']
+    assert result['pending'] == '2024-07-12'
+    assert result['rebased'] == ['AAA.US', 'BBB.US']
+    assert ps.PanelStore(store_dir).dates[-1] == pd.Timestamp('2024-07-11')
+
+    # Once published, the next update picks the day up (the stale answer was not cached)
+    (bulk_dir / '2024-07-12.json').write_text(published)
+    result = bi.update_store(store_dir, 'demo', end_date='2024-07-12')
+    assert result['appended'] == 1 and result['pending'] is None
+
+    # The store now matches one built from the current per-ticker history
+    reference = ps.build_panel_store(di.download_data('demo', TICKERS, '2024-06-03', '2024-07-12'), str(tmp_path / 'reference'))
+    store = ps.PanelStore(store_dir)
+    assert list(store.dates) == list(reference.dates)
+    for field in ps.PANEL_FIELDS:
+        np.testing.assert_allclose(store.field(field), reference.field(field))
+    for ticker in TICKERS:
+        np.testing.assert_array_equal(store.events('dividends', ticker), reference.events('dividends', ticker))
+
+
+def test_unknown_missing_weekday_stops_the_update(serve, tmp_path):
+    store_dir = str(tmp_path / 'store')
+    serve(os.path.join(FIXTURES, 'backfill'))
+    bi.create_store(store_dir, 'demo', TICKERS, '2024-06-03', '2024-06-28')
+
+    # No bulk files at all: 2024-07-01 is not a holiday, so nothing after it is appended
+    serve(os.path.join(FIXTURES, 'backfill'))
+    result = bi.update_store(store_dir, 'demo', end_date='2024-07-12')
+    assert result['appended'] == 0 and result['pending'] == '2024-07-01'
+    assert not list((tmp_path / 'cache').glob('US/**/*.json'))  # Empty bulk answers are not cached
+
+
+def test_us_holidays():
+    holidays = bi.exchange_holidays('US', '2024-01-01', '2024-12-31').strftime('%Y-%m-%d').tolist()
+    assert holidays == ['2024-01-01', '2024-01-15', '2024-02-19', '2024-03-29', '2024-05-27', '2024-06-19',
+                        '2024-07-04', '2024-09-02', '2024-11-28', '2024-12-25']
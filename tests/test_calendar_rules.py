@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import calendar_rules as cr
+
+# Trading days: Monday 2021-03-01 to Friday 2021-03-12, without Wednesday 2021-03-10
+TRADING_DAYS = np.array(pd.bdate_range('2021-03-01', '2021-03-12').drop(pd.Timestamp('2021-03-10')).values, dtype='datetime64[ns]')
+
+
+def dates(*values):
+    return np.array(pd.DatetimeIndex(values).values, dtype='datetime64[ns]')
+
+
+def rolled(rule, *values):
+    days, valid = cr.apply_rule(dates(*values), rule, TRADING_DAYS)
+    return [str(day)[:10] for day in days], list(valid)
+
+
+def test_calendar_offset_and_rolls():
+    # Saturday 2021-03-06 + 1 calendar day is Sunday, which rolls to Monday or back to Friday
+    assert rolled(cr.calendar_rule('ex_dividend', 1), '2021-03-06') == (['2021-03-08'], [True])
+    assert rolled(cr.calendar_rule('ex_dividend', 1, roll='preceding'), '2021-03-06') == (['2021-03-05'], [True])
+    assert rolled(cr.calendar_rule('ex_dividend', -2), '2021-03-12') == (['2021-03-11'], [True])  # Holiday rolls forward
+
+
+def test_roll_none_drops_non_trading_days():
+    rule = cr.calendar_rule('ex_dividend', 0, roll='none')
+    assert rolled(rule, '2021-03-09', '2021-03-10', '2021-03-13') == (['2021-03-09'], [True, False, False])
+
+
+def test_rolls_at_calendar_edges():
+    # Nothing follows the last trading day, and nothing precedes the first
+    assert rolled(cr.calendar_rule('earnings', 0), '2021-03-13') == ([], [False])
+    assert rolled(cr.calendar_rule('earnings', 0, roll='preceding'), '2021-03-13') == (['2021-03-12'], [True])
+    assert rolled(cr.calendar_rule('earnings', 0, roll='preceding'), '2021-02-28') == ([], [False])
+    assert rolled(cr.calendar_rule('earnings', 0), '2021-02-28') == (['2021-03-01'], [True])
+
+
+def test_trading_day_offsets():
+    # The anchor rolls onto the calendar first, then moves by trading days (skipping the holiday)
+    assert rolled(cr.calendar_rule('ex_dividend', 2, unit='trading'), '2021-03-08') == (['2021-03-11'], [True])
+    assert rolled(cr.calendar_rule('ex_dividend', 1, unit='trading'), '2021-03-06') == (['2021-03-09'], [True])
+    assert rolled(cr.calendar_rule('earnings', -1, unit='trading', roll='preceding'), '2021-03-07') == (['2021-03-04'], [True])
+    # Offsets past either end of the calendar are dropped
+    assert rolled(cr.calendar_rule('ex_dividend', 2, unit='trading'), '2021-03-11') == ([], [False])
+    assert rolled(cr.calendar_rule('ex_dividend', -1, unit='trading'), '2021-03-01') == ([], [False])
+
+
+def test_unknown_rule_settings_raise():
+    with pytest.raises(ValueError):
+        cr.calendar_rule('full_moon')
+    with pytest.raises(ValueError):
+        cr.calendar_rule('earnings', unit='hours')
+    with pytest.raises(ValueError):
+        cr.calendar_rule('earnings', roll='nearest')
+
+
+def ticker_data(dividends, earnings):
+    days = pd.bdate_range('2021-01-01', '2021-06-30')
+    return {'prices': pd.DataFrame({'adjusted_close': np.ones(len(days))}, index=days),
+            'dividends': [pd.Timestamp(date) for date in dividends], 'earnings_dates': dates(*earnings)}
+
+
+def test_schedule_drops_trades_that_do_not_sell_after_buying():
+    # The first exit anchor after 2021-03-01 is 2021-03-03: selling 5 days before it
+    # would be before the buy, so the trade is dropped; the 2021-04-01 entry is kept
+    data = {'A': ticker_data(['2021-03-01', '2021-04-01'], ['2021-03-03', '2021-05-03'])}
+    schedule = cr.compile_trade_schedule(data, cr.calendar_rule('ex_dividend', 0), cr.calendar_rule('earnings', -5, roll='preceding'),
+                                         '2021-01-01', '2021-06-30')
+    buy_dates, sell_dates = schedule['A']
+    assert list(pd.DatetimeIndex(buy_dates)) == [pd.Timestamp('2021-04-01')]
+    assert list(pd.DatetimeIndex(sell_dates)) == [pd.Timestamp('2021-04-28')]
+
+    # Selling on the buy day itself is dropped too
+    schedule = cr.compile_trade_schedule(data, cr.calendar_rule('ex_dividend', 0), cr.calendar_rule('earnings', -2, roll='preceding'),
+                                         '2021-01-01', '2021-06-30')
+    assert list(pd.DatetimeIndex(schedule['A'][0])) == [pd.Timestamp('2021-04-01')]
+
+
+def test_schedule_keeps_edge_trades_rolled_into_the_range():
+    # Rolled on the full calendar first, then filtered: an entry on the Saturday before the
+    # start and an exit on the Sunday after the end still give a trade
+    data = {'A': ticker_data(['2021-03-06'], ['2021-03-14'])}
+    schedule = cr.compile_trade_schedule(data, *cr.default_rules(0, 0), '2021-03-08', '2021-03-12')
+    assert [list(pd.DatetimeIndex(dates_)) for dates_ in schedule['A']] == [[pd.Timestamp('2021-03-08')], [pd.Timestamp('2021-03-12')]]
@@ -0,0 +1,62 @@
+import os
+import pandas as pd
+import pytest
+
+import process
+import top_stocks as ts
+from conftest import START_DATE
+
+
+def run_process(downloaded_data, end_date, checkpoint_path=None, block_mask=None):
+    market_caps = process.process_market_caps(downloaded_data)
+    top_stocks = ts.create_top_stocks_membership(market_caps, START_DATE, end_date, 5)
+    trade_log = []
+    investment_results, free_capital_errors = process.process(downloaded_data, top_stocks, 1, 2, 1000, 3, block_mask=block_mask,
+                                                              trade_log=trade_log, checkpoint_path=checkpoint_path)
+    return investment_results, free_capital_errors, trade_log
+
+
+def assert_same_run(resumed, full):
+    assert list(resumed[0].items()) == list(full[0].items())
+    assert resumed[1] == full[1]
+    assert resumed[2] == full[2]
+
+
+def test_resume_matches_full_run(downloaded_data, tmp_path, capsys):
+    checkpoint_path = str(tmp_path / 'run.pkl')
+    block_mask = pd.DataFrame(False, index=pd.date_range(START_DATE, '2022-09-09'), columns=list(downloaded_data))
+    block_mask.iloc[300:320, :3] = True
+
+    run_process(downloaded_data, '2022-01-04', checkpoint_path, block_mask)
+    for end_date in ['2022-01-05', '2022-01-06', '2022-03-15']:
+        size = os.path.getsize(checkpoint_path)
+        resumed = run_process(downloaded_data, end_date, checkpoint_path, block_mask)
+        assert 'Resuming from checkpoint' in capsys.readouterr().out
+        assert os.path.getsize(checkpoint_path) < 2 * size  # Appended to, not rewritten with everything twice
+        assert_same_run(resumed, run_process(downloaded_data, end_date, block_mask=block_mask))
+
+
+def test_resume_after_data_change(downloaded_data, tmp_path):
+    # A corrected price in the middle of the history resumes from before it
+    checkpoint_path = str(tmp_path / 'run.pkl')
+    run_process(downloaded_data, '2022-06-01', checkpoint_path)
+
+    changed = dict(downloaded_data)
+    ticker = next(iter(changed))
+    prices = changed[ticker]['prices'].copy()
+    prices.iloc[400:, 0] *= 1.5
+    changed[ticker] = {**changed[ticker], 'prices': prices}
+
+    assert_same_run(run_process(changed, '2022-06-02', checkpoint_path), run_process(changed, '2022-06-02'))
+
+
+def test_incomplete_record_is_ignored(downloaded_data, tmp_path, capsys):
+    # An interrupted run leaves a partly written segment at the end of the file
+    checkpoint_path = str(tmp_path / 'run.pkl')
+    run_process(downloaded_data, '2022-06-01', checkpoint_path)
+    with open(checkpoint_path, 'r+b') as f:
+        f.truncate(os.path.getsize(checkpoint_path) - 100)
+
+    resumed = run_process(downloaded_data, '2022-06-01', checkpoint_path)
+    assert 'Resuming from checkpoint' in capsys.readouterr().out
+    assert_same_run(resumed, run_process(downloaded_data, '2022-06-01'))
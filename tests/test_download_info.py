@@ -0,0 +1,50 @@
+import json
+import multiprocessing
+import os
+import time
+import pytest
+
+import download_info as di
+
+URL = "https://eodhd.com/api/eod/AAA.US?from=2020-01-01&to=2020-12-31&api_token=demo&fmt=json"
+
+
+def slow_download(url, cache_file):
+    # Stand-in for download_json that records each call in a shared file
+    with open(os.path.join(os.path.dirname(cache_file), 'downloads.txt'), 'a') as f:
+        f.write(f"{os.getpid()}\n")
+    time.sleep(0.5)
+    data = [{'date': '2020-01-02', 'adjusted_close': 1.0}]
+    di.write_cache(cache_file, data)
+    return data, 200
+
+
+def fetch(cache_dir, results):
+    results.put(di.download_and_cache_json(URL, str(cache_dir), count_access=False))
+
+
+def test_second_process_waits_for_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(di, 'download_json', slow_download)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=fetch, args=(tmp_path, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+        time.sleep(0.1)  # The second one starts while the first is downloading
+    for worker in workers:
+        worker.join(10)
+
+    assert [results.get(timeout=1) for _ in workers] == [([{'date': '2020-01-02', 'adjusted_close': 1.0}], 200)] * 2
+    downloads = next(tmp_path.rglob('downloads.txt')).read_text().split()
+    assert len(downloads) == 1
+
+
+def test_write_cache_is_atomic(tmp_path):
+    cache_file = str(tmp_path / 'data.json')
+    di.write_cache(cache_file, {'value': 1})
+
+    # A write that fails half way leaves the previous file as it was, and no temporary file
+    with pytest.raises(TypeError):
+        di.write_cache(cache_file, {'value': 2, 'unserializable': object()})
+    assert di.read_cache(cache_file) == {'value': 1}
+    assert os.listdir(tmp_path) == ['data.json']
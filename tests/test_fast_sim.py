@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import calendar_rules as cr
+import fast_sim as fs
+import process
+import top_stocks as ts
+from conftest import START_DATE, make_downloaded_data
+
+
+def run_process(downloaded_data, top_stocks, days_after_dividend, days_before_earnings, num_pools):
+    trade_log = []
+    investment_results, free_capital_errors = process.process(downloaded_data, top_stocks, days_after_dividend, days_before_earnings,
+                                                              1000, num_pools, trade_log=trade_log)
+    return process.investment_results_to_equity(investment_results), free_capital_errors, trade_log
+
+
+@pytest.mark.parametrize('days_after_dividend, days_before_earnings, num_pools', [(0, 0, 4), (1, 2, 2), (3, 1, 10)])
+def test_simulate_matches_process(downloaded_data, top_stocks, days_after_dividend, days_before_earnings, num_pools):
+    equity, free_capital_errors, trade_log = run_process(downloaded_data, top_stocks, days_after_dividend, days_before_earnings, num_pools)
+
+    model = fs.build_model(downloaded_data, top_stocks)
+    buy_days, sell_days, ticker_idx = fs.build_trades(model, *cr.default_rules(days_after_dividend, days_before_earnings))
+    result = fs.simulate(model, buy_days, sell_days, ticker_idx, 1000, num_pools, record_trades=True)
+
+    assert result['final_value'] == pytest.approx(equity['Total'].iloc[-1])
+    assert result['num_trades'] == sum(1 for trade in trade_log if trade['action'] == 'buy')
+    assert result['free_capital_errors'] == len(free_capital_errors)
+
+    fast_equity = fs.equity_curve(model, result['trades'], 1000, num_pools)
+    np.testing.assert_allclose(fast_equity['Total'].to_numpy(), equity['Total'].to_numpy())
+
+
+def test_simulate_range_matches_process_on_range(downloaded_data):
+    # A sub-range of the model simulates like process.process run on that range alone
+    market_caps = process.process_market_caps(downloaded_data)
+    top_stocks = ts.create_top_stocks_membership(market_caps, START_DATE, '2022-09-09', 5)
+    range_top_stocks = ts.create_top_stocks_membership(market_caps, '2020-06-01', '2021-06-01', 5)
+    equity, free_capital_errors, trade_log = run_process(downloaded_data, range_top_stocks, 1, 1, 3)
+
+    model = fs.build_model(downloaded_data, top_stocks)
+    start_day = model['dates'].get_loc(range_top_stocks.first_date)
+    end_day = model['dates'].get_loc(range_top_stocks.last_date)
+    result = fs.simulate(model, *fs.build_trades(model, *cr.default_rules(1, 1)), 1000, 3, start_day=start_day, end_day=end_day)
+
+    assert result['final_value'] == pytest.approx(equity['Total'].iloc[-1])
+    assert result['num_trades'] == sum(1 for trade in trade_log if trade['action'] == 'buy')
+    assert result['free_capital_errors'] == len(free_capital_errors)
+
+
+def test_unsupported_options_raise(downloaded_data, top_stocks):
+    import monte_carlo as mc
+    import walk_forward as wf
+
+    exit_mask = pd.DataFrame(False, index=pd.date_range(START_DATE, periods=3), columns=list(downloaded_data))
+    with pytest.raises(ValueError):
+        mc.run_monte_carlo(downloaded_data, top_stocks, 0, 0, 1000, 4, START_DATE, '2022-09-09', num_paths=1, exit_mask=exit_mask)
+    with pytest.raises(ValueError):
+        wf.run_walk_forward(downloaded_data, top_stocks, {'days_after_dividend': [0]}, 1000, 4, START_DATE, '2022-09-09', allocation='split')
+    with pytest.raises(ValueError):
+        fs.check_supported(cr.calendar_rule('ex_dividend', 1, unit='trading'), cr.calendar_rule('earnings'))
+
+
+def test_simulate_matches_process_at_range_edges():
+    # An ex-dividend date on the Saturday before the start rolls forward onto the first
+    # day, and an earnings date on the Sunday after the end rolls back onto the last day
+    downloaded_data = make_downloaded_data(4, '2019-08-01', '2020-03-31')
+    for data in downloaded_data.values():
+        data['dividends'] = [pd.Timestamp('2019-09-07'), pd.Timestamp('2019-12-07')]
+        data['earnings_dates'] = pd.DatetimeIndex(['2019-10-20', '2020-02-02']).values
+    top_stocks = ts.create_top_stocks_membership(process.process_market_caps(downloaded_data), '2019-09-09', '2020-01-31', 4)
+    equity, free_capital_errors, trade_log = run_process(downloaded_data, top_stocks, 0, 0, 4)
+    assert sum(1 for trade in trade_log if trade['action'] == 'buy') == 8
+
+    model = fs.build_model(downloaded_data, top_stocks)
+    result = fs.simulate(model, *fs.build_trades(model, *cr.default_rules(0, 0)), 1000, 4)
+    assert result['final_value'] == pytest.approx(equity['Total'].iloc[-1])
+    assert result['num_trades'] == 8
+    assert result['free_capital_errors'] == len(free_capital_errors)
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import pandas as pd
+
+import panel_store as ps
+from conftest import make_downloaded_data
+
+
+def test_append_after_interrupted_write(downloaded_data, tmp_path):
+    store_dir = str(tmp_path / 'panel')
+    panel = ps.build_panel_store(downloaded_data, store_dir)
+    num_dates, num_tickers = len(panel.days), len(panel.tickers)
+
+    # An append that stopped before meta.json was updated: rows left in some files only
+    with open(os.path.join(store_dir, 'adjusted_close.bin'), 'ab') as f:
+        np.full((3, num_tickers), 123.0).tofile(f)
+    with open(os.path.join(store_dir, 'dates.bin'), 'ab') as f:
+        np.array([10 ** 6], dtype=np.int64).tofile(f)
+
+    new_dates = pd.bdate_range(panel.dates[-1] + pd.Timedelta(days=1), periods=2)
+    prices = np.arange(2 * num_tickers, dtype=float).reshape(2, num_tickers)
+    assert ps.append_trading_days(store_dir, new_dates, {'adjusted_close': prices}) == 2
+
+    panel = ps.PanelStore(store_dir)
+    assert os.path.getsize(os.path.join(store_dir, 'adjusted_close.bin')) == (num_dates + 2) * num_tickers * 8
+    assert list(panel.dates[-2:]) == list(new_dates)
+    np.testing.assert_array_equal(panel.field('adjusted_close')[-2:], prices)
+    assert np.isnan(panel.field('market_cap')[-2:]).all()
+    # The rows before the append are untouched
+    np.testing.assert_array_equal(panel.field('adjusted_close')[:num_dates],
+                                  ps.build_panel_store(downloaded_data, str(tmp_path / 'fresh')).field('adjusted_close'))
+
+
+def test_last_valid_before_scans_back_in_chunks(tmp_path):
+    # Prices 1000 business days long: A has a value only on row 10 (found after several
+    # doubling chunks), B on every row, C never
+    days = pd.bdate_range('2015-01-01', periods=1000, name='date')
+    values = {'A': np.full(1000, np.nan), 'B': np.arange(1000, dtype=float), 'C': np.full(1000, np.nan)}
+    values['A'][10] = 7.0
+    downloaded_data = {ticker: {'prices': pd.DataFrame({'adjusted_close': column}, index=days).dropna(),
+                                'market_cap': pd.DataFrame()} for ticker, column in values.items()}
+    panel = ps.build_panel_store(downloaded_data, str(tmp_path / 'panel'))
+
+    np.testing.assert_array_equal(panel.last_valid_before('adjusted_close', 999, [0, 1, 2]), [7.0, 998.0, np.nan])
+    np.testing.assert_array_equal(panel.last_valid_before('adjusted_close', 11, [0]), [7.0])
+    assert np.isnan(panel.last_valid_before('adjusted_close', 10, [0])).all()
+    assert np.isnan(panel.last_valid_before('adjusted_close', 0, [0, 1, 2])).all()
+
+
+def test_to_downloaded_data_round_trip(tmp_path):
+    downloaded_data = make_downloaded_data(4)
+    panel = ps.build_panel_store(downloaded_data, str(tmp_path / 'panel'))
+
+    restored = panel.to_downloaded_data()
+    for ticker, data in downloaded_data.items():
+        pd.testing.assert_frame_equal(restored[ticker]['prices'], data['prices'], check_freq=False)
+        pd.testing.assert_frame_equal(restored[ticker]['market_cap'], data['market_cap'], check_freq=False)
+        assert restored[ticker]['dividends'] == data['dividends']
+        np.testing.assert_array_equal(restored[ticker]['earnings_dates'], data['earnings_dates'])
+
+    # A date range keeps only the rows and events inside it
+    ticker = 'T01.US'
+    restored = panel.to_downloaded_data([ticker], '2020-01-01', '2020-12-31')[ticker]
+    prices = downloaded_data[ticker]['prices']
+    pd.testing.assert_frame_equal(restored['prices'], prices.loc['2020-01-01':'2020-12-31'], check_freq=False)
+    assert restored['dividends'] == [date for date in downloaded_data[ticker]['dividends'] if pd.Timestamp('2020-01-01') <= date <= pd.Timestamp('2020-12-31')]
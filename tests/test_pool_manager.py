@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import pool_manager as pm
+
+
+def old_loop(events, initial_investment, num_pools):
+    # The per-pool scans process.process used before PoolManager: sales due today first,
+    # then each buy goes to the lowest numbered available pool with free capital
+    free_capital_pools = [initial_investment / num_pools] * num_pools
+    pool_availability = [True] * num_pools
+    pending_sales = [None] * num_pools
+    history = []
+    for day, buys, price_factors in events:
+        for i in range(num_pools):
+            if pending_sales[i] and pending_sales[i]['sell_date'] == day:
+                free_capital_pools[i] += pending_sales[i]['amount'] * price_factors[pending_sales[i]['ticker']]
+                pending_sales[i] = None
+                pool_availability[i] = True
+        for ticker, sell_date in buys:
+            for i in range(num_pools):
+                if free_capital_pools[i] > 0 and pool_availability[i]:
+                    pending_sales[i] = {'ticker': ticker, 'sell_date': sell_date, 'amount': free_capital_pools[i]}
+                    history.append((day, ticker, i, free_capital_pools[i]))
+                    free_capital_pools[i] = 0
+                    pool_availability[i] = False
+                    break
+            else:
+                history.append((day, ticker, None, None))
+    return history, free_capital_pools
+
+
+def new_manager(events, initial_investment, num_pools, policy='first_free'):
+    pools = pm.PoolManager(initial_investment, num_pools, policy)
+    history = []
+    for day, buys, price_factors in events:
+        for i in pools.due_sales(day):
+            pools.sell(i, price_factors[pools.holdings[i]['ticker']])
+        for ticker, sell_date in buys:
+            bought = pools.buy(ticker, day, sell_date, 1.0)
+            history.append((day, ticker) + (bought if bought else (None, None)))
+    return history, [pools.free_capital(i) for i in range(num_pools)]
+
+
+def random_events(seed, num_days=300, num_tickers=12):
+    # Random buys with sell dates 1-30 days later, and prices relative to a buy price of 1
+    # (sometimes 0, so a pool can lose everything)
+    rng = np.random.default_rng(seed)
+    events = []
+    for day in range(num_days):
+        buys = [(int(ticker), day + int(rng.integers(1, 30))) for ticker in rng.choice(num_tickers, rng.integers(0, 4), replace=False)]
+        price_factors = np.where(rng.random(num_tickers) < 0.02, 0.0, rng.uniform(0.8, 1.3, num_tickers))
+        events.append((day, buys, price_factors))
+    return events
+
+
+@pytest.mark.parametrize('seed, num_pools', [(0, 3), (1, 10), (2, 1)])
+def test_first_free_matches_old_loop(seed, num_pools):
+    events = random_events(seed)
+    old_history, old_free = old_loop(events, 1000, num_pools)
+    new_history, new_free = new_manager(events, 1000, num_pools)
+    # Same pool (or no free capital) for every buy, with the same amount
+    assert [h[:3] for h in new_history] == [h[:3] for h in old_history]
+    np.testing.assert_allclose([np.nan if h[3] is None else h[3] for h in new_history],
+                               [np.nan if h[3] is None else h[3] for h in old_history])
+    np.testing.assert_allclose(new_free, old_free)
+
+
+def test_no_capital_no_buys():
+    pools = pm.PoolManager(0, 3)
+    assert pools.buy('A', 0, 5, 1.0) is None
+
+
+def test_richest_first():
+    pools = pm.PoolManager(300, 3, 'richest_first')
+    assert pools.buy('A', 0, 1, 1.0) == (0, 100)
+    assert pools.buy('B', 0, 2, 1.0) == (1, 100)
+    # Pool 1 doubles, pool 0 halves: pool 1 is now the richest free pool, then pool 2
+    for i, price in zip(pools.due_sales(2), [0.5, 2.0]):
+        pools.sell(i, price)
+    assert pools.buy('C', 3, 4, 1.0) == (1, 200)
+    assert pools.buy('D', 3, 4, 1.0) == (2, 100)
+    assert pools.buy('E', 3, 4, 1.0) == (0, 50)
+    assert pools.buy('F', 3, 4, 1.0) is None
+
+
+def test_split():
+    pools = pm.PoolManager(300, 3, 'split')
+    assert pools.buy('A', 0, 1, 1.0)[1] == pytest.approx(100)
+    pools.sell(pools.due_sales(1)[0], 2.0)  # Free capital is now 200 + 200 over 3 pools
+    assert pools.total_free_capital == pytest.approx(400)
+    assert pools.free_capital(0) == pytest.approx(400 / 3)
+    assert [pools.buy(ticker, 2, 5, 1.0)[1] for ticker in 'BCD'] == pytest.approx([400 / 3] * 3)
+    assert pools.total_free_capital == pytest.approx(0)
+
+
+def test_forced_exit_sells_early_and_skips_the_stale_sale():
+    pools = pm.PoolManager(200, 2)
+    pools.buy('A', 0, 10, 1.0)
+    pools.buy('B', 0, 10, 1.0)
+    assert pools.due_sales(3, forced_tickers={'B'}) == [1]
+    pools.sell(1, 1.0)
+    pools.buy('C', 4, 20, 1.0)  # Pool 1 again, with a later sell date
+    assert pools.due_sales(10) == [0]
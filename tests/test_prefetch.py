@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import time
+import pandas as pd
+import pytest
+
+import download_info as di
+import prefetch as pf
+
+CLOSED_WINDOW = {'start_date': '2020-01-01', 'end_date': '2020-12-31'}
+OPEN_WINDOW = {'start_date': '2020-01-01', 'end_date': 'today'}
+
+
+def make_config(tickers, windows, **settings):
+    return {'api_key': 'demo', 'datasets': ['prices'], 'universes': [{'name': 'test', 'tickers': tickers, 'windows': windows}], **settings}
+
+
+def cache_file(ticker, window, now):
+    return di.cache_file_for_url(di.dataset_url('prices', ticker, window['start_date'], pf.resolve_date(window['end_date'], now), 'demo'))
+
+
+def write_cached(path, hours_ago):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    di.write_cache(path, [])
+    modified = time.time() - hours_ago * 3600
+    os.utime(path, (modified, modified))
+
+
+@pytest.fixture
+def in_tmp_dir(tmp_path, monkeypatch):
+    # The cache directory is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_plan_priority_order(in_tmp_dir):
+    now = pd.Timestamp.now()
+    write_cached(cache_file('A.US', OPEN_WINDOW, now), hours_ago=24)  # Still open when downloaded: stale
+    write_cached(cache_file('B.US', OPEN_WINDOW, now), hours_ago=1)   # Recent: warm
+    config = make_config(['A.US', 'B.US'], [CLOSED_WINDOW, OPEN_WINDOW])
+    stats = {'A.US': {'hits': 1, 'misses': 0}, 'B.US': {'hits': 5, 'misses': 5}}
+
+    plan = [(task['ticker'], task['end_date'], task['reason']) for task in pf.plan_prefetch(config, stats, now)]
+    assert plan == [('B.US', '2020-12-31', 'missing'), ('A.US', '2020-12-31', 'missing'), ('A.US', now.strftime('%Y-%m-%d'), 'stale')]
+
+    forced = pf.plan_prefetch(config, stats, now, force_refresh=True)
+    assert [(task['ticker'], task['reason']) for task in forced][-1] == ('B.US', 'forced')
+
+
+def fake_downloads(monkeypatch, status_codes):
+    # Replaces the download with one that returns the next status code (or raises it)
+    calls = []
+
+    def download(url, force_refresh=False, count_access=True):
+        result = status_codes[len(calls)]
+        calls.append(url)
+        if isinstance(result, BaseException):
+            raise result
+        return ({} if result == 200 else None), result
+    monkeypatch.setattr(di, 'download_and_cache_json', download)
+    return calls
+
+
+def test_stops_at_budget(in_tmp_dir, monkeypatch):
+    calls = fake_downloads(monkeypatch, [200] * 4)
+    config = make_config(['A.US', 'B.US', 'C.US', 'D.US'], [CLOSED_WINDOW], budget=5, costs={'prices': 2})
+    status = pf.run_prefetch(config, status_file='status.json')
+
+    assert len(calls) == 2
+    assert (status['state'], status['calls_used'], status['completed'], status['remaining']) == ('budget_exhausted', 4, 2, 2)
+    assert pf.read_status('status.json')['state'] == 'budget_exhausted'
+
+
+def test_stops_at_quota(in_tmp_dir, monkeypatch):
+    calls = fake_downloads(monkeypatch, [200, 429, 200])
+    status = pf.run_prefetch(make_config(['A.US', 'B.US', 'C.US'], [CLOSED_WINDOW]), status_file='status.json')
+
+    assert len(calls) == 2
+    assert status['state'] == 'quota_exceeded'
+    assert [failure['status_code'] for failure in status['failed']] == [429]
+
+
+def test_download_errors_are_recorded(in_tmp_dir, monkeypatch):
+    fake_downloads(monkeypatch, [ConnectionError("refused"), 200])
+    status = pf.run_prefetch(make_config(['A.US', 'B.US'], [CLOSED_WINDOW]), status_file='status.json')
+
+    assert (status['state'], status['completed']) == ('done', 1)
+    assert status['failed'][0]['error'] == "ConnectionError: refused"
+
+
+def test_interrupted_run_is_not_left_running(in_tmp_dir, monkeypatch):
+    fake_downloads(monkeypatch, [KeyboardInterrupt()])
+    with pytest.raises(KeyboardInterrupt):
+        pf.run_prefetch(make_config(['A.US'], [CLOSED_WINDOW]), status_file='status.json')
+    assert pf.read_status('status.json')['state'] == 'failed'
+
+
+def count_accesses(stats_file, rounds):
+    for _ in range(rounds):
+        di.record_access('A.US', hit=True)
+        di.save_access_stats(stats_file)
+
+
+def test_access_stats_from_several_processes(tmp_path):
+    stats_file = str(tmp_path / 'access_stats.json')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=count_accesses, args=(stats_file, 25)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    assert di.load_access_stats(stats_file)['A.US']['hits'] == 100
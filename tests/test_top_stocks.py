@@ -0,0 +1,19 @@
+import pytest
+
+import panel_store as ps
+import process
+import top_stocks as ts
+from conftest import START_DATE
+
+
+@pytest.mark.parametrize('start_date, end_date, num_stocks', [(START_DATE, '2022-09-09', 5), ('2020-03-07', '2021-01-01', 3),
+                                                               ('2019-09-01', '2022-09-12', 20)])
+def test_panel_matches_market_caps(downloaded_data, tmp_path, start_date, end_date, num_stocks):
+    panel = ps.build_panel_store(downloaded_data, str(tmp_path / 'panel'))
+    membership = ts.create_top_stocks_from_panel(panel, start_date, end_date, num_stocks)
+    expected = ts.create_top_stocks_membership(process.process_market_caps(downloaded_data), start_date, end_date, num_stocks)
+
+    assert isinstance(membership, ts.TopStocksMembership)
+    assert list(membership.change_dates) == list(expected.change_dates)
+    assert membership.members == expected.members
+    assert membership.end == expected.end
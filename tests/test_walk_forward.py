@@ -0,0 +1,35 @@
+import pytest
+
+import walk_forward as wf
+from conftest import START_DATE, END_DATE
+
+
+def test_stitched_equity_is_one_continuous_curve(downloaded_data, top_stocks):
+    equity, windows, metrics = wf.run_walk_forward(downloaded_data, top_stocks, {'days_after_dividend': [0, 2], 'days_before_earnings': [1]},
+                                                   1000, 4, START_DATE, END_DATE, train_months=12, test_months=6)
+    assert len(windows) > 1
+    assert equity.index.is_unique and equity.index.is_monotonic_increasing
+    assert equity.index[0] == windows['test_start'].iloc[0] and equity.index[-1] == windows['test_end'].iloc[-1]
+    # Each test window starts with the capital the previous one ended with
+    assert (windows['test_start_capital'].iloc[1:].to_numpy() == windows['test_end_capital'].iloc[:-1].to_numpy()).all()
+
+
+@pytest.mark.parametrize('step_months', [3, 9])
+def test_step_must_match_test_window(downloaded_data, top_stocks, step_months):
+    with pytest.raises(ValueError):
+        wf.run_walk_forward(downloaded_data, top_stocks, {'days_after_dividend': [0]}, 1000, 4, START_DATE, END_DATE,
+                            train_months=12, test_months=6, step_months=step_months)
+
+
+def test_train_windows_end_before_their_test_windows(downloaded_data, top_stocks):
+    for window in wf.make_windows(START_DATE, END_DATE, 12, 6):
+        assert window['train_end'] < window['test_start']
+
+    _, windows, _ = wf.run_walk_forward(downloaded_data, top_stocks, {'days_after_dividend': [0, 2]}, 1000, 4,
+                                        START_DATE, END_DATE, train_months=12, test_months=6)
+    trading_days = set().union(*(data['prices'].index for data in downloaded_data.values()))
+    assert (windows['train_end'] < windows['test_start']).all()
+    # The last trading day before the test window, not just any earlier day
+    for train_end, test_start in zip(windows['train_end'], windows['test_start']):
+        assert train_end in trading_days
+        assert not any(train_end < day < test_start for day in trading_days)
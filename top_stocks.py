@@ -1,9 +1,9 @@
-from io import BytesIO
-import base64
-import matplotlib.pyplot as plt
+import bisect
 import pandas as pd
 import numpy as np
 
+import chart_utils as cu
+
 
 def get_top_n_stocks(market_caps_data, date_filter, num_stocks):
     latest_caps = {}
@@ -54,12 +54,208 @@ def create_top_stocks_by_date(market_caps, start_date, end_date, num_stocks):
 
     return top_stocks_by_date
 
+
+def create_top_stocks_from_panel(panel, start_date, end_date, num_stocks):
+    """
+    Same top lists as create_top_stocks_membership, but ranked directly on the
+    memory-mapped market cap matrix of a panel_store.PanelStore instead of a dict of
+    DataFrames. Only the rows between start_date and end_date are read.
+
+    Returns:
+        TopStocksMembership: Top lists from start_date to end_date.
+    """
+    start = pd.to_datetime(start_date)
+    end = pd.to_datetime(end_date)
+
+    i0, i1 = panel.row_range(start, end)
+    columns = np.arange(len(panel.tickers))
+
+    # Forward-fill the touched slice, seeding it with the last value before the range
+    # (in effect from the start, until the first stored day replaces it)
+    caps = np.array(panel.field('market_cap', start, end))
+    seed = panel.last_valid_before('market_cap', i0, columns)
+    caps = np.vstack([seed[np.newaxis, :], caps])
+    caps = pd.DataFrame(caps).ffill().to_numpy()
+    dates = [start] + list(panel.dates[i0:i1])
+    if len(dates) > 1 and dates[1] == start:
+        dates, caps = dates[1:], caps[1:]
+
+    return _rank_top_stocks(dates, panel.tickers, caps, num_stocks, end)
+
+
+def _rank_top_stocks(dates, tickers, caps, num_stocks, end):
+    # Top list of each row of caps (the latest market cap of every ticker, NaN for none),
+    # in effect from the matching date on
+    tickers = np.asarray(tickers, dtype=object)
+    members = []
+    for row in caps:
+        valid = np.flatnonzero(~np.isnan(row))
+        # Stable sort keeps ticker order for ties, matching get_top_n_stocks
+        order = valid[np.argsort(-row[valid], kind='stable')][:num_stocks]
+        members.append(list(tickers[order]))
+    return TopStocksMembership(dates, members, end)
+
+
+class TopStocksMembership:
+    """
+    Top-N membership stored as change points instead of one list per day.
+
+    The top list only changes when new market caps arrive, so the lists are kept once
+    per change point, plus per-ticker membership intervals [start, end) for O(log n)
+    "is this ticker in the top list on this date" checks. Memory follows the number of
+    rank changes, not days x N.
+
+    Attributes:
+        change_dates (pd.DatetimeIndex): Days on which the top list changes.
+        members (list): Top list (tickers by rank) from each change date on.
+        end (pd.Timestamp): Last day covered.
+        intervals (dict): ticker -> (start days, end days), lists of nanosecond timestamps.
+    """
+
+    def __init__(self, change_dates, members, end):
+        # Merge consecutive change points with the same list
+        dates = []
+        lists = []
+        for date, stocks in zip(pd.DatetimeIndex(change_dates), members):
+            if not lists or list(stocks) != lists[-1]:
+                dates.append(date)
+                lists.append(list(stocks))
+        self.change_dates = pd.DatetimeIndex(dates, name='Date')
+        self.members = lists
+        self.end = pd.Timestamp(end)
+        self._change_values = [date.value for date in self.change_dates]
+
+        # Membership intervals per ticker
+        next_values = self._change_values[1:] + [(self.end + pd.Timedelta(days=1)).value]
+        self.intervals = {}
+        for i, stocks in enumerate(self.members):
+            for ticker in stocks:
+                starts, ends = self.intervals.setdefault(ticker, ([], []))
+                if ends and ends[-1] == self._change_values[i]:
+                    ends[-1] = next_values[i]  # Still a member: extend the interval
+                else:
+                    starts.append(self._change_values[i])
+                    ends.append(next_values[i])
+
+    @classmethod
+    def from_frame(cls, top_stocks_by_date):
+        # From the one-row-per-day frame of create_top_stocks_by_date (days missing from
+        # the frame have no top stocks)
+        dates = []
+        members = []
+        previous = None
+        for date, stocks in zip(top_stocks_by_date.index, top_stocks_by_date['Stock']):
+            if previous is not None and date - previous > pd.Timedelta(days=1):
+                dates.append(previous + pd.Timedelta(days=1))
+                members.append([])
+            dates.append(date)
+            members.append(stocks)
+            previous = date
+        end = top_stocks_by_date.index.max() if len(top_stocks_by_date) else pd.Timestamp(0)
+        return cls(dates, members, end)
+
+    @property
+    def first_date(self):
+        # First day with any top stocks (None if there are none)
+        for date, stocks in zip(self.change_dates, self.members):
+            if stocks:
+                return date
+        return None
+
+    @property
+    def last_date(self):
+        # Last day with any top stocks (None if there are none)
+        for i in range(len(self.members) - 1, -1, -1):
+            if self.members[i]:
+                return self.end if i == len(self.members) - 1 else self.change_dates[i + 1] - pd.Timedelta(days=1)
+        return None
+
+    def is_member(self, ticker, date):
+        # True if the ticker is in the top list on the date
+        if ticker not in self.intervals:
+            return False
+        starts, ends = self.intervals[ticker]
+        value = pd.Timestamp(date).value
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value < ends[i]
+
+    def members_on(self, date):
+        # Top list on the date (empty outside the covered days)
+        value = pd.Timestamp(date).value
+        i = bisect.bisect_right(self._change_values, value) - 1
+        if i < 0 or value > self.end.value:
+            return []
+        return self.members[i]
+
+    def to_frame(self):
+        """
+        Converts to the frame of create_top_stocks_by_date: one row per day with top
+        stocks, 'Stock' holding the list. Days between two change points share one list.
+        """
+        dates = []
+        stocks = []
+        next_dates = list(self.change_dates[1:]) + [self.end + pd.Timedelta(days=1)]
+        for date, next_date, members in zip(self.change_dates, next_dates, self.members):
+            if members:
+                days = pd.date_range(date, next_date - pd.Timedelta(days=1), freq='D')
+                dates.append(days)
+                stocks.extend([members] * len(days))
+        index = dates[0].append(dates[1:]) if dates else pd.DatetimeIndex([])
+        return pd.DataFrame({'Stock': stocks}, index=pd.DatetimeIndex(index, name='Date'))
+
+
+def as_membership(top_stocks):
+    # Accepts either a TopStocksMembership or a create_top_stocks_by_date frame
+    if isinstance(top_stocks, TopStocksMembership):
+        return top_stocks
+    return TopStocksMembership.from_frame(top_stocks)
+
+
+def create_top_stocks_membership(market_caps, start_date, end_date, num_stocks):
+    """
+    Same top lists as create_top_stocks_by_date, but ranked only on the days market
+    caps change and returned as a TopStocksMembership.
+    """
+    start = pd.to_datetime(start_date)
+    end = pd.to_datetime(end_date)
+
+    # Latest market cap of every ticker on each day a value changes (keeping the last
+    # of duplicate dates, like get_top_n_stocks)
+    series = {}
+    for ticker, data in market_caps.items():
+        if data.empty:
+            print(f"No data available for {ticker}.")
+            continue
+        values = data['value']
+        series[ticker] = values[~values.index.duplicated(keep='last')]
+    if not series:
+        print("No stocks have data up to the specified date.")
+        return TopStocksMembership([], [], end)
+    caps = pd.DataFrame(series).sort_index().ffill()
+
+    # Rank on the last row on or before the start, then on every change inside the range
+    first_row = max(caps.index.searchsorted(start, side='right') - 1, 0)
+    caps = caps.iloc[first_row:]
+    caps = caps.loc[caps.index <= end]
+
+    dates = [max(date, start) for date in caps.index]
+    values = caps.to_numpy(dtype=float)
+
+    # Days before the first market cap have no top stocks
+    if not dates or dates[0] > start:
+        dates.insert(0, start)
+        values = np.vstack([np.full((1, values.shape[1]), np.nan), values])
+    return _rank_top_stocks(dates, caps.columns, values, num_stocks, end)
+
+
 def chart_top_stocks(top_stocks_by_date):
-    # "Explode" the DataFrame, splitting the lists in each row into separate rows
-    df = top_stocks_by_date.explode('Stock')
+    plt = cu.pyplot()
+
+    # Membership intervals (a create_top_stocks_by_date frame is converted)
+    membership = as_membership(top_stocks_by_date)
 
-    # Get unique stocks and dynamically set the figure height based on the number of stocks
-    unique_stocks = df['Stock'].unique()
+    # Get unique stocks (in order of first appearance) and dynamically set the figure height based on the number of stocks
+    unique_stocks = list(dict.fromkeys(stock for stocks in membership.members for stock in stocks))
     num_stocks = len(unique_stocks)
     height = max(3, num_stocks * 0.25)  # Set a minimum height of 4, scaling with the number of stocks
 
@@ -68,10 +264,11 @@ def chart_top_stocks(top_stocks_by_date):
     # Assign each stock a unique offset on the y-axis
     stock_offsets = {stock: i for i, stock in enumerate(unique_stocks, 1)}
 
-    for stock in unique_stocks:
-        stock_data = df[df['Stock'] == stock]
-        # Apply an offset to each stock to separate them vertically, only show markers
-        ax.plot(stock_data.index, np.repeat(stock_offsets[stock], len(stock_data)), label=stock, marker='o', linestyle='')
+    for i, stock in enumerate(unique_stocks):
+        starts, ends = membership.intervals[stock]
+        # One horizontal bar per membership interval [start, end), at the stock's offset
+        ax.hlines(np.repeat(stock_offsets[stock], len(starts)), pd.to_datetime(starts), pd.to_datetime(ends),
+                  label=stock, color=f"C{i % 10}", linewidth=4)
 
     # Formatting the plot
     ax.set_title('Top Stocks Over Time')
@@ -84,9 +281,5 @@ def chart_top_stocks(top_stocks_by_date):
     plt.legend(title='Stocks', bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.tight_layout()
 
-    # Save the plot to a BytesIO object
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    # Convert plot to base64 string
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    # Save the plot and convert it to a base64 string
+    return cu.figure_to_base64(plt)
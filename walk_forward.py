@@ -0,0 +1,187 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+import calendar_rules as cr
+import fast_sim as fs
+
+# Walk-forward optimisation.
+#
+# The period is split into rolling train/test windows. On each train window every
+# parameter combination in the grid is simulated and the best one (by the chosen
+# metric) is then run out-of-sample on the following test window. A train window ends
+# on the last trading day before its test window, so no test-window price is used to
+# choose the parameters. Test windows are stitched into one equity curve, each starting
+# with the capital the previous one ended with (open positions are valued at the window
+# boundary, i.e. liquidated there).
+#
+# The aligned prices, top-N membership and trading calendars (fast_sim.build_model)
+# are built once, and each parameter combination's trade schedule is compiled once
+# over the whole period; windows only select the trades that fall inside them.
+
+PARAMETER_NAMES = ['days_after_dividend', 'days_before_earnings', 'num_pools']
+
+
+def make_windows(start_date, end_date, train_months, test_months, step_months=None):
+    """
+    Splits start_date..end_date into rolling windows.
+
+    Args:
+        start_date, end_date (str): Whole period.
+        train_months (int): Length of each train window.
+        test_months (int): Length of each test window.
+        step_months (int): How far the windows move each time (default test_months,
+            so test windows follow each other without gaps or overlap). run_walk_forward
+            only accepts the default, since it stitches the test windows back to back.
+
+    Returns:
+        list: Dicts with train_start, train_end, test_start and test_end timestamps.
+            A train window ends the day before its test window starts (run_walk_forward
+            moves that back to the last trading day).
+    """
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    step_months = step_months or test_months
+
+    windows = []
+    train_start = start
+    while True:
+        test_start = train_start + pd.DateOffset(months=train_months)
+        test_end = min(test_start + pd.DateOffset(months=test_months), end)
+        if test_start >= end:
+            break
+        windows.append({'train_start': train_start, 'train_end': test_start - pd.Timedelta(days=1), 'test_start': test_start, 'test_end': test_end})
+        if test_end >= end:
+            break
+        train_start = train_start + pd.DateOffset(months=step_months)
+
+    return windows
+
+
+def parameter_grid(grid):
+    # Expands {'days_after_dividend': [0, 1], ...} into a list of parameter dicts
+    for name in grid:
+        if name not in PARAMETER_NAMES:
+            raise ValueError(f"Unknown parameter '{name}', expected one of {PARAMETER_NAMES}")
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_walk_forward(downloaded_data, top_stocks_by_date, grid, initial_investment, num_pools, start_date, end_date,
+                     train_months=24, test_months=6, step_months=None, objective='annualized_return', block_mask=None,
+                     exit_mask=None, allocation='first_free'):
+    """
+    Runs a walk-forward optimisation.
+
+    Args:
+        downloaded_data (dict): Dictionary containing the stock data.
+        top_stocks_by_date: Top stocks by date over the whole period (TopStocksMembership or frame).
+        grid (dict): Parameter name -> list of values to try (see PARAMETER_NAMES).
+        initial_investment (float): Starting capital.
+        num_pools (int): Number of pools, unless it is part of the grid.
+        start_date, end_date (str): Whole period.
+        train_months, test_months (int): Window sizes (see make_windows).
+        step_months (int): Must be None or test_months: the test windows are stitched
+            back to back, so they may neither overlap nor leave gaps.
+        objective (str): 'annualized_return' or 'overall_return' to maximise on train windows.
+        block_mask (pd.DataFrame): Optional breakout block mask.
+        exit_mask, allocation: As for process.process; only None and 'first_free' are
+            supported (anything else raises a ValueError, see fast_sim.check_supported).
+
+    Returns:
+        tuple: (stitched out-of-sample equity DataFrame, per-window DataFrame with the
+            chosen parameters and train/test results, out-of-sample metrics dict)
+    """
+    if step_months not in (None, test_months):
+        raise ValueError(f"step_months ({step_months}) must equal test_months ({test_months}), "
+                         "so the stitched test windows neither overlap nor leave gaps")
+    combinations = parameter_grid(grid)
+    fs.check_supported(exit_mask=exit_mask, allocation=allocation)
+    model = fs.build_model(downloaded_data, top_stocks_by_date, block_mask)
+    dates = model['dates']
+
+    # Compile each distinct schedule once over the whole period
+    schedules = {}
+    event_cache = {}
+    for params in combinations:
+        key = (params.get('days_after_dividend', 0), params.get('days_before_earnings', 0))
+        if key not in schedules:
+            entry_rule, exit_rule = cr.default_rules(*key)
+            for rule in (entry_rule, exit_rule):
+                if rule['anchor'] not in event_cache:
+                    event_cache[rule['anchor']] = fs.anchor_events(model, rule['anchor'])
+            schedules[key] = fs.build_trades(model, entry_rule, exit_rule,
+                                             entry_events=event_cache[entry_rule['anchor']],
+                                             exit_events=event_cache[exit_rule['anchor']])
+
+    def day_number(date):
+        # Clamp window boundaries to the days covered by the model
+        return int(np.clip((pd.Timestamp(date) - dates[0]).days, 0, len(dates) - 1))
+
+    # Days on which any ticker has a price, to end train windows on
+    trading_days = [cr.trading_days_for(downloaded_data[ticker]) for ticker in model['tickers']]
+    trading_days = np.unique((np.concatenate(trading_days) - np.datetime64(dates[0], 'ns')) // np.timedelta64(1, 'D')) \
+        if trading_days else np.empty(0, dtype=np.int64)
+
+    def last_trading_day_before(day):
+        position = np.searchsorted(trading_days, day, side='left') - 1
+        return int(trading_days[position]) if position >= 0 else day - 1
+
+    def run(params, capital, first_day, last_day, record_trades=False):
+        buy_days, sell_days, ticker_idx = schedules[(params.get('days_after_dividend', 0), params.get('days_before_earnings', 0))]
+        return fs.simulate(model, buy_days, sell_days, ticker_idx, capital, params.get('num_pools', num_pools),
+                           record_trades=record_trades, start_day=first_day, end_day=last_day)
+
+    capital = initial_investment
+    equity_parts = []
+    window_rows = []
+
+    for number, window in enumerate(make_windows(start_date, end_date, train_months, test_months, step_months)):
+        test_first, test_last = day_number(window['test_start']), day_number(window['test_end'])
+        # Positions are valued on the train window's last day, so it must be before the test window
+        train_first, train_last = day_number(window['train_start']), last_trading_day_before(test_first)
+        if train_last <= train_first or test_last <= test_first:
+            continue
+
+        # Optimise on the train window, always from the same starting capital
+        best_params, best_score = None, None
+        for params in combinations:
+            result = run(params, initial_investment, train_first, train_last)
+            score = fs.strategy_metrics(result['final_value'], dates[train_first], dates[train_last], initial_investment)[objective]
+            if best_score is None or score > best_score:
+                best_params, best_score = params, score
+
+        # Out-of-sample run with the chosen parameters, starting from the stitched capital
+        result = run(best_params, capital, test_first, test_last, record_trades=True)
+        test_metrics = fs.strategy_metrics(result['final_value'], dates[test_first], dates[test_last], capital)
+        equity = fs.equity_curve(model, result['trades'], capital, best_params.get('num_pools', num_pools), test_first, test_last)
+        equity['window'] = number
+        # The boundary day is the first day of the next window, so keep it only once
+        equity_parts.append(equity if not equity_parts else equity.iloc[1:])
+
+        print(f"Window {number}: train {dates[train_first].date()} - {dates[train_last].date()}, "
+              f"test {dates[test_first].date()} - {dates[test_last].date()}, chosen {best_params}, "
+              f"train {objective} {best_score:.2f}%, test return {test_metrics['overall_return']:.2f}%")
+
+        window_rows.append({
+            'window': number,
+            'train_start': dates[train_first], 'train_end': dates[train_last],
+            'test_start': dates[test_first], 'test_end': dates[test_last],
+            **{f"chosen_{name}": value for name, value in best_params.items()},
+            f"train_{objective}": best_score,
+            'test_overall_return': test_metrics['overall_return'],
+            'test_annualized_return': test_metrics['annualized_return'],
+            'test_start_capital': capital,
+            'test_end_capital': result['final_value']
+        })
+        capital = result['final_value']
+
+    if not equity_parts:
+        print("No complete walk-forward windows in the requested period.")
+        return pd.DataFrame(), pd.DataFrame(window_rows), {}
+
+    equity = pd.concat(equity_parts)
+    windows = pd.DataFrame(window_rows)
+    metrics = fs.strategy_metrics(capital, windows['test_start'].iloc[0], windows['test_end'].iloc[-1], initial_investment, equity)
+
+    return equity, windows, metrics